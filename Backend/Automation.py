@@ -12,11 +12,21 @@ import requests  # Import requests for making HTTP requests.
 import keyboard  # Import keyboard for keyboard related actions.
 import asyncio  # Import asyncio for asynchronous programming.
 import os  # Import os for operating system functionalities.
+import sys  # Import sys to extend the import path when run as a script.
+
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.Deadline import TimeLeft  # Bound command execution by the query's budget.
 
 #Load environment variables from a .env file
 env_vars = dotenv_values(".env")
 GroqAPIKey = env_vars.get("GroqAPIKey")  # Retrieve the Groq API key.
 
+# Seconds commands always get to finish, even when the query's budget is used up;
+# the user asked for them, so they aren't dropped just because the answer was slow.
+MIN_COMMAND_TIMEOUT = 5
+
 # Define CSS classes for parsing specific elements in HTML content.
 classes = ["cZubwf", "hgKElc", "LTKOO sY7ric", "Z0LCw", "gsrt vk_bk FzvWSb YwPhNf", "pclqee", "tw-Data-text tw-text-small tw-ta",
            "IZ6rdc", "O5uRsd LTKOO", "vLzY6d", "webanswers-webanswers_table__webanswers-table", "dONo ikb4Bb gsrt", "sXLaOe",
@@ -174,7 +184,7 @@ def System(command):
 
       return True  # Indicate success.
 # Asynchronous function to translate and execute user commands.
-async def TranslateAndExecute(commands: list[str]):
+async def TranslateAndExecute(commands: list[str], deadline=None):
       funcs = []  # List to store asynchronous tasks.
    
       for command in commands:
@@ -209,14 +219,19 @@ async def TranslateAndExecute(commands: list[str]):
             else:
                   print(f"No Function for: {command}")# Print a message for unhandled commands.
                   
-      results=await asyncio.gather(*funcs)  # Execute the scheduled tasks.
+      try:
+            # Execute the scheduled tasks, waiting no longer than the query's budget allows.
+            results = await asyncio.wait_for(asyncio.gather(*funcs), TimeLeft(deadline, minimum=MIN_COMMAND_TIMEOUT))
+      except asyncio.TimeoutError:
+            print("Automation ran out of time; remaining tasks continue in the background")
+            return
       for result in results:
             if isinstance(result, str):
                   yield result  # Yield the result.
             else:
                   yield result  # Yield the result.
 #Asynchronous function to Automate command execution.
-async def Automation(commands: list[str]):
-      async for result in TranslateAndExecute(commands):
+async def Automation(commands: list[str], deadline=None):
+      async for result in TranslateAndExecute(commands, deadline):
             pass
       return True  # Indicate success.
\ No newline at end of file
@@ -0,0 +1,109 @@
+import threading  # Import threading for the flag shared between the loop and worker threads.
+import traceback  # Import traceback for detailed error information.
+
+INTERRUPTED_MARKER = "[interrupted]"  # Appended to answers that were cut off by new input.
+
+class QueryCancelled(Exception):
+    """Raised by ``CancelToken.Check`` once the query has been cancelled."""
+
+class CancelToken:
+    """Cooperative cancellation for one query, shared by every stage it reaches.
+
+    ``Cancel`` may be called from any thread. Code that can stop early polls
+    ``cancelled`` (or calls ``Check``); code blocked on I/O registers a
+    callback, e.g. closing an HTTP stream, which runs when the token fires.
+    ``Alive`` fits the ``func`` hook of ``textToSpeech.TTS`` and ``is_set``
+    lets the token stand in for a ``threading.Event`` stop flag.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def Cancel(self, reason="cancelled"):
+        """Fire the token; returns False if it had already fired."""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in cancel callback: {e}")
+                traceback.print_exc()
+        return True
+
+    def AddCallback(self, callback):
+        """Call ``callback()`` when the token fires, or right away if it already has."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return callback
+        callback()
+        return callback
+
+    def RemoveCallback(self, callback):
+        with self._lock:
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                pass
+
+    def Check(self):
+        """Raise QueryCancelled if the token has fired."""
+        if self._event.is_set():
+            raise QueryCancelled(self.reason)
+
+    def Alive(self, *args):
+        """False once cancelled; pass as ``func`` to stop TTS playback."""
+        return not self._event.is_set()
+
+    def Wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+# Function to iterate a streaming model response until it ends or is cancelled.
+def CancellableStream(stream, cancel=None):
+    """Yield from ``stream``, stopping as soon as ``cancel`` fires.
+
+    The stream's ``close`` is registered on the token, so a reader blocked
+    waiting for the next chunk is released by closing the connection rather
+    than waiting for the model to send more.
+    """
+    if cancel is None:
+        yield from stream
+        return
+
+    close = getattr(stream, "close", None)
+    if close is not None:
+        cancel.AddCallback(close)
+    try:
+        for item in stream:
+            if cancel.cancelled:
+                break
+            yield item
+    except Exception:
+        if not cancel.cancelled:
+            raise
+        # The connection was closed under the reader by Cancel.
+    finally:
+        if close is not None:
+            cancel.RemoveCallback(close)
+            if cancel.cancelled:
+                close()
+
+# Function to tag an answer that was cut off.
+def MarkInterrupted(text):
+    return f"{text.rstrip()} {INTERRUPTED_MARKER}".strip()
@@ -0,0 +1,129 @@
+import argparse  # Import argparse for the compaction command line.
+import json  # Import json to encode one message per line.
+import os  # Import os for low-level appends and atomic replacement.
+import sys  # Import sys to extend the import path when run as a script.
+import threading  # Import threading to serialise writers within the process.
+
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ChatLogPath = os.path.join("Data", "ChatLog.jsonl")
+LegacyChatLogPath = os.path.join("Data", "ChatLog.json")
+
+_lock = threading.Lock()
+_migrated = False
+
+def _encode(messages):
+    return "".join(json.dumps(message, ensure_ascii=False) + "\n" for message in messages).encode("utf-8")
+
+def _write_atomically(path, data):
+    """Replace ``path`` with ``data`` through a temporary file, so readers never see half of it."""
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+# Function to move the old JSON array log to the JSON-lines log, once.
+def MigrateLegacyLog(path=ChatLogPath, legacy_path=LegacyChatLogPath):
+    """Copy ``ChatLog.json`` into ``ChatLog.jsonl`` if the new log doesn't exist yet.
+
+    The old file is renamed to ``ChatLog.json.migrated`` and kept as a backup.
+    Returns the number of messages migrated.
+    """
+    with _lock:
+        if os.path.exists(path) or not os.path.exists(legacy_path):
+            return 0
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as file:
+                messages = json.load(file)
+        except ValueError as e:
+            print(f"Old chat log could not be read, starting a new one: {e}")
+            messages = []
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        _write_atomically(path, _encode(messages))
+        os.replace(legacy_path, legacy_path + ".migrated")
+        print(f"Migrated {len(messages)} messages from {legacy_path} to {path}")
+        return len(messages)
+
+def _ensure_migrated(path):
+    """Migrate the old log the first time the default log is used."""
+    global _migrated
+    if path == ChatLogPath and not _migrated:
+        MigrateLegacyLog()
+        _migrated = True
+
+# Function to read the whole chat history.
+def ReadChatLog(path=ChatLogPath):
+    """Return the logged messages, oldest first.
+
+    A line that doesn't parse, like the tail of an append cut short by a
+    crash, is skipped rather than losing the whole log.
+    """
+    _ensure_migrated(path)
+    messages = []
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    messages.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return messages
+
+# Function to add messages to the end of the chat history.
+def AppendMessages(messages, path=ChatLogPath):
+    """Append ``messages`` with a single write to a file opened for appending.
+
+    The cost doesn't depend on the size of the history, and the write is
+    either all there or cut off at the end, where ReadChatLog skips it.
+    """
+    _ensure_migrated(path)
+    data = _encode(messages)
+    with _lock:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+# Function to replace the whole chat history.
+def RewriteChatLog(messages, path=ChatLogPath):
+    _ensure_migrated(path)
+    with _lock:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        _write_atomically(path, _encode(messages))
+
+# Function to shrink the log file.
+def CompactChatLog(keep=None, path=ChatLogPath):
+    """Rewrite the log without unreadable lines, keeping only the last ``keep`` messages if given.
+
+    Returns ``(messages before, messages after)``.
+    """
+    messages = ReadChatLog(path)
+    kept = messages if keep is None else messages[-keep:] if keep else []
+    RewriteChatLog(kept, path)
+    return len(messages), len(kept)
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the JSON-lines chat log.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="copy Data/ChatLog.json into the JSON-lines log")
+    migrate.add_argument("--log", default=ChatLogPath)
+    compact = commands.add_parser("compact", help="rewrite the log without unreadable lines")
+    compact.add_argument("--keep", type=int, help="keep only the most recent messages")
+    compact.add_argument("--log", default=ChatLogPath)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        print(f"{MigrateLegacyLog(args.log)} messages migrated")
+    else:
+        before, after = CompactChatLog(args.keep, args.log)
+        print(f"Compacted {args.log}: {before} messages, {after} kept")
+
+if __name__ == "__main__":
+    main()
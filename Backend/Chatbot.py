@@ -1,7 +1,18 @@
 from groq import Groq  # Importing the Groq library to use its API.
-from json import load, dump  # Importing functions to read and write JSON files.
 import datetime  # Importing the datetime module for real-time date and time information.
 from dotenv import dotenv_values  # Importing dotenv_values to read environment variables from a .env file.
+import os  # Importing os for file path handling.
+import sys  # Importing sys to extend the import path when run as a script.
+from time import perf_counter  # Importing perf_counter to time the answers.
+
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.Cancellation import CancellableStream, MarkInterrupted
+from Backend.Conversation import GetConversation
+from Backend.ContextWindow import GetContextWindow, ContextTokens
+from Backend.ConversationStore import TokenUsage
+from Backend.Deadline import TimeLeft, MIN_STREAM_TIMEOUT
 
 # Load environment variables from the .env file.
 try:
@@ -54,50 +65,80 @@ def RealtimeInformation():
 def AnswerModifier(Answer):
     return '\n'.join([line for line in Answer.split('\n') if line.strip()])
 
+# Model used for general answers.
+ChatModel = "llama3-70b-8192"
+
 # Function to load chat history
 def load_chat_log():
-    try:
-        with open(r"Data/ChatLog.json", "r") as f:
-            return load(f)
-    except (FileNotFoundError, ValueError):
-        return []
+    return GetConversation().Messages()
 
 # Function to save chat history
 def save_chat_log(messages):
-    with open(r"Data/ChatLog.json", "w") as f:
-        dump(messages, f, indent=4)
+    GetConversation().Rewrite(messages)
+
+# Function to append one question and answer to the chat history.
+def AppendChatExchange(Query, Answer, interrupted=False, **metadata):
+    """Log the exchange; ``metadata`` (route, model, latency, tokens) is stored with the answer."""
+    Answer = MarkInterrupted(Answer) if interrupted else Answer
+    GetConversation().AddExchange(Query, Answer, interrupted=interrupted, **metadata)
+
+# Function to stream the chatbot's answer as the model produces it.
+def ChatBotStream(Query, save=True, cancel=None, deadline=None, metadata=None, context_tokens=None):
+    """Yield the answer to the user's query in chunks.
+
+    The exchange is logged once the stream ends, unless ``save`` is False;
+    speculative answers are logged with AppendChatExchange once committed.
+    When the ``cancel`` token fires, or the consumer closes the generator, the
+    model stream is closed and the partial answer is logged as interrupted.
+    The request times out when the ``deadline`` runs out before it is answered.
+    ``metadata``, if given, is a dict that receives the model, latency and
+    token counts for the chat log. The chat history sent along is the recent
+    turns that fit ``context_tokens`` plus a summary of the older ones; see
+    ContextWindow.
+    """
+    metadata = {} if metadata is None else metadata
+    metadata.update(route=metadata.get("route", "general"), model=ChatModel)
+    started = perf_counter()
+    messages = GetContextWindow().Messages(context_tokens, query=Query)
+    messages.append({"role": "user", "content": Query})
+
+    completion = client.chat.completions.create(
+        model=ChatModel,  # Specify the AI model to use.
+        messages=SystemChatBot + [{"role": "system", "content": RealtimeInformation()}] + messages,
+        max_tokens=2048,  # Increased from 1024 to allow for more detailed responses
+        temperature=0.8,  # Slightly increased for more creative responses
+        top_p=1,
+        stream=True,
+        stop=None,
+        timeout=TimeLeft(deadline, 60, minimum=MIN_STREAM_TIMEOUT)  # 60 s is the client default when there is no deadline
+    )
+
+    Answer = ""  # Initialize an empty string to store the AI's response.
+    interrupted = False
+    try:
+        for chunk in CancellableStream(completion, cancel):
+            metadata.update(TokenUsage(chunk))
+            if chunk.choices and chunk.choices[0].delta.content:
+                Answer += chunk.choices[0].delta.content
+                yield chunk.choices[0].delta.content.replace("</s>", "")
+    except GeneratorExit:
+        interrupted = True  # The consumer stopped reading.
+    interrupted = interrupted or (cancel is not None and cancel.cancelled)
+    metadata["latency"] = perf_counter() - started
+
+    if save:
+        AppendChatExchange(Query, Answer.replace("</s>", ""), interrupted, **metadata)
 
 # Main chatbot function to handle user queries.
 def ChatBot(Query):
     """This function sends the user's query to the chatbot and returns the AI's response."""
     try:
-        messages = load_chat_log()
-        messages.append({"role": "user", "content": Query})
-
-        completion = client.chat.completions.create(
-            model="llama3-70b-8192",  # Specify the AI model to use.
-            messages=SystemChatBot + [{"role": "system", "content": RealtimeInformation()}] + messages,
-            max_tokens=2048,  # Increased from 1024 to allow for more detailed responses
-            temperature=0.8,  # Slightly increased for more creative responses
-            top_p=1,
-            stream=True,
-            stop=None
-        )
-
-        Answer = ""  # Initialize an empty string to store the AI's response.
-        for chunk in completion:
-            if chunk.choices[0].delta.content:
-                Answer += chunk.choices[0].delta.content
-        
-        Answer = Answer.replace("</s>", "")
-        messages.append({"role": "assistant", "content": Answer})
-        save_chat_log(messages)
-        return AnswerModifier(Answer)
+        return AnswerModifier("".join(ChatBotStream(Query)))
 
     except Exception as e:
         print(f"Error: {e}")
-        save_chat_log([])  # Reset chat log on failure
-        return ChatBot(Query)  # Retry the query after resetting the log.
+        # Retry once with less history; the chat log itself is left alone.
+        return AnswerModifier("".join(ChatBotStream(Query, context_tokens=ContextTokens // 4)))
 
 # Main program entry point.
 if __name__ == "__main__":
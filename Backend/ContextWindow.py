@@ -0,0 +1,261 @@
+from groq import Groq  # Import the Groq library to summarize old turns.
+from dotenv import dotenv_values  # Import dotenv_values to read the budget settings.
+import json  # Import json to keep the summary across restarts.
+import math  # Import math to round token estimates up.
+import os  # Import os for file path handling.
+import re  # Import re to count words when estimating tokens.
+import sys  # Import sys to extend the import path when run as a script.
+import threading  # Import threading to refresh the summary once at a time.
+import time  # Import time to space out summary requests.
+import traceback  # Import traceback for detailed error information.
+
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.Conversation import GetConversation
+from Backend.Scheduler import SubmitBackground
+from Backend.SemanticMemory import GetMemory
+
+env_vars = dotenv_values(".env")
+Username = env_vars.get("Username", "User")
+Assistantname = env_vars.get("Assistantname", "Jarvis")
+
+# Tokens of chat history sent with each question; the rest of the 8192-token
+# context holds the instructions, search results and the answer.
+ContextTokens = int(env_vars.get("ContextTokens", 3000))
+SUMMARY_TOKENS = 300  # Longest summary the model is asked to write.
+SUMMARY_CHUNK_TOKENS = 3000  # Old turns folded into the summary per request.
+# Most unsummarized history folded in at once, e.g. on the first run with a long
+# history; turns older than that are left to the semantic memory.
+SUMMARY_BACKLOG_TOKENS = 4 * SUMMARY_CHUNK_TOKENS
+SUMMARY_PAUSE = 20  # Least seconds between summary requests, so live answers keep the rate limit.
+# Tokens of turns that must have left the window before a summary request is
+# made; fewer wait for more to gather instead of costing a request per query.
+SUMMARY_MIN_TOKENS = 1000
+MAX_WINDOW_MESSAGES = 200  # Most recent messages looked at when filling the budget.
+# Opt-in: also recall older turns related to the question from the semantic memory.
+UseSemanticMemory = env_vars.get("SemanticMemory", "False").lower() == "true"
+RECALL_TURNS = 4  # Most past exchanges recalled per question.
+RECALL_SHARE = 0.25  # Share of the budget the recalled turns may take from the recent window.
+RECALL_ANSWER_CHARS = 600  # Recalled answers are cut to about this many characters.
+
+SummaryModel = "llama3-8b-8192"
+SummaryPath = os.path.join("Data", "Summary.json")
+
+client = Groq(api_key=env_vars.get("GroqAPIKey"))
+
+_WORD = re.compile(r"\w+|[^\w\s]")
+
+# Function to estimate how many tokens a text takes.
+def CountTokens(text):
+    """Rough Llama token count: about four characters or three quarters of a word each, whichever is more."""
+    return max(math.ceil(len(text) / 4), math.ceil(len(_WORD.findall(text)) * 4 / 3))
+
+# Function to estimate the tokens of a chat message, including its framing.
+def MessageTokens(message):
+    return CountTokens(message["content"]) + 4
+
+class ContextWindow:
+    """Chat history for a prompt, kept within a token budget.
+
+    The most recent turns that fit the budget are sent as they are. Older
+    turns are folded into a rolling summary, sent ahead of them as a system
+    message. Given the question, the older exchanges most related to it are
+    recalled from the semantic memory and sent between the two, taking at
+    most RECALL_SHARE of the budget from the oldest recent turns.
+
+    When turns drop out of the window, the summary is extended in the
+    background, so no prompt waits for it. Until then the prompt carries the
+    previous summary. A summary request is only made once SUMMARY_MIN_TOKENS
+    of turns have left the window, at least SUMMARY_PAUSE seconds after the
+    last one, and folds in at most SUMMARY_BACKLOG_TOKENS of history, so
+    summarizing never holds a worker for long or competes with the answers
+    for the Groq rate limit. The summary and the number of messages it
+    covers are saved to Data/Summary.json, so a restart doesn't summarize the
+    whole history again.
+    """
+
+    def __init__(self, conversation, path=SummaryPath):
+        self.conversation = conversation
+        self.path = path
+        self.summary = ""
+        self.covered = 0  # Messages from the start of the history the summary covers.
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._last_request = float("-inf")  # When the last summary request was made
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                saved = json.load(file)
+            self.summary, self.covered = saved["summary"], saved["covered"]
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+    def _save(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"summary": self.summary, "covered": self.covered}, file, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def Messages(self, budget=None, query=None):
+        """The summary, turns recalled for ``query`` and the most recent messages, within ``budget`` tokens."""
+        budget = ContextTokens if budget is None else budget
+        total, tail = self.conversation.Tail(MAX_WINDOW_MESSAGES)
+        with self._lock:
+            if self.covered > total:  # The history was rewritten
+                self.summary, self.covered = "", 0
+            summary, covered = self.summary, self.covered
+
+        summary_message = []
+        if summary:
+            summary_message = [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}]
+            budget -= MessageTokens(summary_message[0])
+
+        window = []
+        for message in reversed(tail):
+            cost = MessageTokens(message)
+            if cost > budget:
+                break
+            window.append(message)
+            budget -= cost
+        window.reverse()
+
+        first = total - len(window)  # Index of the first message sent as it is
+        recall_message = []
+        if query and UseSemanticMemory:
+            share = (budget + sum(MessageTokens(message) for message in window)) * RECALL_SHARE
+            recall_message = self._recall(query, first, share)
+            if recall_message:
+                budget -= MessageTokens(recall_message[0])
+                while budget < 0 and window:  # Make room from the oldest side
+                    budget += MessageTokens(window.pop(0))
+                    first += 1
+
+        if first > covered:
+            self._start_refresh(first)
+        return summary_message + recall_message + window
+
+    def _recall(self, query, before, budget):
+        """A system message with the exchanges older than message ``before`` most related to ``query``."""
+        try:
+            exchanges = GetMemory().Recall(query, RECALL_TURNS, before)
+        except Exception as e:
+            print(f"Error recalling earlier turns: {e}")
+            return []
+        header = "Earlier turns that may be relevant:"
+        lines, used = [], CountTokens(header) + 4
+        for exchange in exchanges:
+            text = "\n".join(f"{Username if m['role'] == 'user' else Assistantname}: {_shorten(m['content'])}"
+                             for m in exchange)
+            cost = CountTokens(text)
+            if used + cost > budget:
+                continue
+            lines.append(text)
+            used += cost
+        if not lines:
+            return []
+        return [{"role": "system", "content": header + "\n" + "\n".join(lines)}]
+
+    def _start_refresh(self, upto):
+        """Start folding messages up to ``upto`` into the summary once enough have gathered."""
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._last_request < SUMMARY_PAUSE:
+                return
+            covered = self.covered
+        tokens = 0
+        for start in range(covered, upto, 64):  # A few messages at a time; the backlog may be the whole history
+            tokens += sum(MessageTokens(message) for message in self.conversation.Range(start, min(upto, start + 64)))
+            if tokens >= SUMMARY_MIN_TOKENS:
+                break
+        else:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        SubmitBackground(self._refresh, upto, name="summarizing the conversation")
+
+    def _refresh(self, upto):
+        """Fold the next chunk of messages ``covered`` to ``upto`` into the summary.
+
+        When more is left, the next chunk is submitted as a new job
+        SUMMARY_PAUSE seconds later.
+        """
+        more = False
+        try:
+            with self._lock:
+                summary, covered = self.summary, self.covered
+            if covered >= upto:
+                return
+            backlog = self.conversation.Range(covered, upto)
+            start, tokens = len(backlog), 0
+            while start > 0 and tokens + MessageTokens(backlog[start - 1]) <= SUMMARY_BACKLOG_TOKENS:
+                start -= 1
+                tokens += MessageTokens(backlog[start])
+            if start:
+                print(f"Summarizing the last {len(backlog) - start} of {len(backlog)} unsummarized messages")
+            chunk, tokens = [], 0
+            for message in backlog[start:]:
+                tokens += MessageTokens(message)
+                if chunk and tokens > SUMMARY_CHUNK_TOKENS:
+                    break
+                chunk.append(message)
+            if not chunk:
+                chunk = backlog[start:start + 1]  # A single message longer than the backlog allows
+            if not chunk:
+                return
+            with self._lock:
+                self._last_request = time.monotonic()
+            new_summary = Summarize(summary, chunk)
+            with self._lock:
+                if self.covered != covered:
+                    return  # The history was rewritten meanwhile
+                self.summary, self.covered = new_summary, covered + start + len(chunk)
+            self._save()
+            more = self.covered < upto
+        except Exception as e:
+            print(f"Error summarizing the conversation: {e}")
+            traceback.print_exc()
+        finally:
+            if more:
+                timer = threading.Timer(SUMMARY_PAUSE, SubmitBackground, (self._refresh, upto),
+                                        {"name": "summarizing the conversation"})
+                timer.daemon = True
+                timer.start()
+            else:
+                with self._lock:
+                    self._refreshing = False
+
+def _shorten(text):
+    return text if len(text) <= RECALL_ANSWER_CHARS else text[:RECALL_ANSWER_CHARS].rstrip() + "..."
+
+# Function to fold turns into a running summary.
+def Summarize(summary, messages):
+    """Ask the summary model for ``summary`` extended with ``messages``."""
+    turns = "\n".join(f"{Username if m['role'] == 'user' else Assistantname}: {m['content']}" for m in messages)
+    prompt = (f"Summary so far:\n{summary or '(none)'}\n\nNew turns:\n{turns}\n\n"
+              f"Rewrite the summary so it also covers the new turns. Keep names, facts about {Username}, "
+              f"preferences, decisions and open requests; drop small talk. Answer with the summary only, "
+              f"in at most {SUMMARY_TOKENS * 3 // 4} words.")
+    completion = client.chat.completions.create(
+        model=SummaryModel,
+        messages=[{"role": "system", "content": "You summarize conversations between a user and an AI assistant."},
+                  {"role": "user", "content": prompt}],
+        max_tokens=SUMMARY_TOKENS * 2,
+        temperature=0.2,
+        timeout=60,
+    )
+    return completion.choices[0].message.content.strip()
+
+_window = None
+_window_lock = threading.Lock()
+
+# Function to get the process-wide context window.
+def GetContextWindow():
+    global _window
+    with _window_lock:
+        if _window is None:
+            _window = ContextWindow(GetConversation())
+        return _window
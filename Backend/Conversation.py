@@ -0,0 +1,149 @@
+import atexit  # Import atexit to write pending turns when the process ends.
+import os  # Import os for file path handling.
+import sys  # Import sys to extend the import path when run as a script.
+import threading  # Import threading for the writer thread and the lock.
+import time  # Import time to timestamp turns and time the flushes.
+import traceback  # Import traceback for detailed error information.
+
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.ConversationStore import GetStore
+from Backend.EventBus import Publish, CHAT_TURN
+
+FLUSH_INTERVAL = 0.5  # Seconds a new turn may wait before it is written.
+BATCH_SIZE = 32  # Pending turns that start a write at once.
+SYNC_INTERVAL = 5.0  # Seconds between syncs of the written turns to disk.
+
+class Conversation:
+    """The chat history in memory, written behind to the conversation store.
+
+    The history is read from the store once. After that, reads are served from
+    memory and new turns are added to memory at once. A writer thread saves
+    them to the store in batches, one transaction per batch, at most
+    FLUSH_INTERVAL later. Every SYNC_INTERVAL it checkpoints the write-ahead
+    log, which syncs what was written to disk. Every change happens under one
+    lock, so answers finishing at the same time never lose each other's
+    turns, and a question always sits next to its answer.
+    """
+
+    def __init__(self, store, flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE, sync_interval=SYNC_INTERVAL):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.sync_interval = sync_interval
+        self._messages = store.Messages()
+        self._pending = []  # Turns not yet written to the store.
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._write_lock = threading.Lock()  # Held while writing to the store, so writes stay in order.
+        self._unsynced = False
+        self._stopped = False
+        self._writer = threading.Thread(target=self._run, name="ConversationWriter", daemon=True)
+        self._writer.start()
+
+    def Messages(self, limit=None):
+        """The last ``limit`` messages (all of them by default), oldest first; don't modify them."""
+        with self._lock:
+            return list(self._messages) if limit is None else self._messages[-limit:] if limit else []
+
+    def Tail(self, limit):
+        """``(total, messages)``: the message count and the last ``limit`` messages, read together."""
+        with self._lock:
+            return len(self._messages), self._messages[-limit:] if limit else []
+
+    def Range(self, start, stop):
+        """Messages ``start`` to ``stop`` counted from the beginning of the history."""
+        with self._lock:
+            return self._messages[start:stop]
+
+    def Count(self):
+        with self._lock:
+            return len(self._messages)
+
+    def AddExchange(self, query, answer, **metadata):
+        """Add a question and its answer; ``metadata`` describes the answer, see ConversationStore."""
+        now = time.time()
+        turns = [{"role": "user", "content": query, "created": now},
+                 {"role": "assistant", "content": answer, "created": now, **metadata}]
+        with self._lock:
+            index = len(self._messages)
+            self._messages.extend({"role": turn["role"], "content": turn["content"]} for turn in turns)
+            self._pending.extend(turns)
+            if len(self._pending) >= self.batch_size:
+                self._wake.notify()
+        Publish(CHAT_TURN, {"query": query, "answer": answer, "index": index})
+
+    def Rewrite(self, messages):
+        """Replace the whole history, in memory and in the store."""
+        with self._write_lock:
+            messages = [{"role": m["role"], "content": m["content"]} for m in messages]
+            with self._lock:
+                self._messages = list(messages)
+                self._pending.clear()
+            self.store.Rewrite(messages)
+
+    def Flush(self):
+        """Write the pending turns to the store now."""
+        with self._write_lock:
+            with self._lock:
+                turns, self._pending = self._pending, []
+            if turns:
+                try:
+                    self.store.AddTurns(turns)
+                    self._unsynced = True
+                except Exception:
+                    with self._lock:
+                        self._pending[:0] = turns  # Try again on the next flush
+                    raise
+
+    def Sync(self):
+        """Write the pending turns and sync them to disk."""
+        self.Flush()
+        if self._unsynced:
+            self.store.Checkpoint()
+            self._unsynced = False
+
+    def Close(self):
+        """Stop the writer thread once everything pending is written and synced."""
+        with self._lock:
+            self._stopped = True
+            self._wake.notify()
+        self._writer.join()
+
+    def _run(self):
+        last_sync = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._stopped and len(self._pending) < self.batch_size:
+                    self._wake.wait(self.flush_interval)
+                stopped = self._stopped
+            try:
+                if stopped or time.monotonic() - last_sync >= self.sync_interval:
+                    self.Sync()
+                    last_sync = time.monotonic()
+                else:
+                    self.Flush()
+            except Exception as e:
+                print(f"Error writing the conversation: {e}")
+                traceback.print_exc()
+            if stopped:
+                return
+
+_conversation = None
+_conversation_lock = threading.Lock()
+
+# Function to get the process-wide conversation, loading it on first use.
+def GetConversation():
+    global _conversation
+    with _conversation_lock:
+        if _conversation is None:
+            _conversation = Conversation(GetStore())
+            atexit.register(_conversation.Close)
+        return _conversation
+
+# Function to write out the last turns at shutdown, without loading the conversation just for that.
+def CloseConversation():
+    conversation = _conversation  # One still loading has no turns to write yet
+    if conversation is not None:
+        conversation.Close()
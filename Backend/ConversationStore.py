@@ -0,0 +1,311 @@
+import argparse  # Import argparse for the import/search command line.
+import datetime  # Import datetime to show when turns were logged.
+import json  # Import json to read old chat log files.
+import os  # Import os for file path handling.
+import sqlite3  # Import sqlite3 for the conversation database.
+import sys  # Import sys to extend the import path when run as a script.
+import threading  # Import threading to share one connection between threads.
+import time  # Import time to timestamp sessions and turns.
+
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.ChatLog import ChatLogPath, ReadChatLog, RewriteChatLog
+
+DatabasePath = os.path.join("Data", "Conversations.db")
+
+# Metadata a turn may carry besides its role and content.
+METADATA = ("latency", "route", "model", "prompt_tokens", "completion_tokens", "interrupted")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    title TEXT
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL,
+    latency REAL,
+    route TEXT,
+    model TEXT,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    interrupted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS turns_session ON turns(session_id, id);
+CREATE INDEX IF NOT EXISTS turns_created ON turns(created);
+"""
+
+# Full-text index kept in step with the turns table by triggers.
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(content, content='turns', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS turns_fts_insert AFTER INSERT ON turns BEGIN
+    INSERT INTO turns_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS turns_fts_delete AFTER DELETE ON turns BEGIN
+    INSERT INTO turns_fts(turns_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS turns_fts_update AFTER UPDATE OF content ON turns BEGIN
+    INSERT INTO turns_fts(turns_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO turns_fts(rowid, content) VALUES (new.id, new.content);
+END;
+"""
+
+INSERT_TURN = ("INSERT INTO turns (session_id, role, content, created, latency, route, model,"
+               " prompt_tokens, completion_tokens, interrupted) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+class ConversationStore:
+    """Chat history in SQLite: sessions, turns with their metadata, and a full-text index.
+
+    The database runs in WAL mode, so the GUI or a script can read it while
+    the assistant writes. One connection is shared by every thread and
+    guarded by a lock. Messages come back in the ``{"role", "content"}``
+    form the chat models take. When SQLite is built without FTS5, search
+    falls back to a slower LIKE scan.
+    """
+
+    def __init__(self, path=DatabasePath):
+        self.path = path
+        self.session = None  # Session new turns are added to; see StartSession.
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(SCHEMA)
+        try:
+            self._db.executescript(FTS_SCHEMA)
+            self.full_text = True
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search not available, searching without an index: {e}")
+            self.full_text = False
+
+    def Close(self):
+        with self._lock:
+            self._db.close()
+
+    # Writing
+
+    def StartSession(self, title=None, started=None):
+        """Start a session and make it the one new turns are added to; returns its id."""
+        with self._lock:
+            cursor = self._db.execute("INSERT INTO sessions (started, title) VALUES (?, ?)",
+                                      (started or time.time(), title))
+            self.session = cursor.lastrowid
+            return self.session
+
+    def _session_id(self, session):
+        if session is not None:
+            return session
+        if self.session is None:
+            self.StartSession()
+        return self.session
+
+    def _insert(self, rows):
+        self._db.executemany(INSERT_TURN, rows)
+
+    @staticmethod
+    def _row(session, role, content, created=None, **metadata):
+        unknown = set(metadata) - set(METADATA)
+        if unknown:
+            raise TypeError(f"Unknown turn metadata: {', '.join(sorted(unknown))}")
+        return (session, role, content, created or time.time(), metadata.get("latency"), metadata.get("route"),
+                metadata.get("model"), metadata.get("prompt_tokens"), metadata.get("completion_tokens"),
+                int(bool(metadata.get("interrupted"))))
+
+    def AddTurn(self, role, content, session=None, **metadata):
+        """Log one message; ``metadata`` may hold any of METADATA. Returns the turn id."""
+        session = self._session_id(session)
+        with self._lock:
+            cursor = self._db.execute(INSERT_TURN, self._row(session, role, content, **metadata))
+            return cursor.lastrowid
+
+    def AddExchange(self, query, answer, session=None, **metadata):
+        """Log a question and its answer in one transaction; ``metadata`` describes the answer."""
+        session = self._session_id(session)
+        now = time.time()
+        rows = [self._row(session, "user", query, now), self._row(session, "assistant", answer, now, **metadata)]
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            self._insert(rows)
+
+    def AddTurns(self, turns, session=None):
+        """Log many messages in one transaction.
+
+        Each turn is a dict with "role" and "content", and optionally
+        "created" and any of METADATA.
+        """
+        session = self._session_id(session)
+        rows = [self._row(session, turn["role"], turn["content"], turn.get("created"),
+                          **{key: turn[key] for key in METADATA if key in turn}) for turn in turns]
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            self._insert(rows)
+
+    def Checkpoint(self):
+        """Copy the write-ahead log into the database file and sync it to disk."""
+        with self._lock:
+            self._db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def Rewrite(self, messages):
+        """Replace the whole history with ``messages`` in one new session."""
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM turns")
+            self._db.execute("DELETE FROM sessions")
+            cursor = self._db.execute("INSERT INTO sessions (started, title) VALUES (?, ?)", (time.time(), None))
+            self.session = cursor.lastrowid
+            self._insert([self._row(self.session, m["role"], m["content"]) for m in messages])
+
+    def Import(self, path, title=None):
+        """Bulk-load a ChatLog.json array or a JSON-lines chat log as one session; returns the turn count."""
+        with open(path, "r", encoding="utf-8") as file:
+            text = file.read()
+        if text.lstrip().startswith("["):
+            messages = json.loads(text)
+        else:
+            messages = [json.loads(line) for line in text.splitlines() if line.strip()]
+        started = os.path.getmtime(path)
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            cursor = self._db.execute("INSERT INTO sessions (started, title) VALUES (?, ?)",
+                                      (started, title or f"Imported from {os.path.basename(path)}"))
+            session = cursor.lastrowid
+            self._insert([self._row(session, m["role"], m["content"], started) for m in messages
+                          if m.get("role") in ("user", "assistant")])
+        return len(messages)
+
+    # Reading
+
+    def Messages(self, limit=None, session=None):
+        """The last ``limit`` messages (all of them by default), oldest first, as chat model messages."""
+        where, args = ("WHERE session_id = ?", [session]) if session is not None else ("", [])
+        sql = f"SELECT role, content FROM turns {where} ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [{"role": row["role"], "content": row["content"]} for row in reversed(rows)]
+
+    def Turns(self, after=0, limit=None, since=None, until=None, session=None):
+        """Turns with their metadata, oldest first; ``after`` skips turn ids up to and including it."""
+        clauses, args = ["id > ?"], [after]
+        for clause, value in (("created >= ?", since), ("created < ?", until), ("session_id = ?", session)):
+            if value is not None:
+                clauses.append(clause)
+                args.append(value)
+        sql = f"SELECT * FROM turns WHERE {' AND '.join(clauses)} ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, args)]
+
+    def Search(self, text, limit=20, since=None, role=None):
+        """Turns matching ``text``, best match first; ``since`` is a Unix time, e.g. a week ago."""
+        clauses, args = [], []
+        if self.full_text:
+            # Quote every word, so user text is never read as FTS5 syntax.
+            words = " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+            if not words:
+                return []
+            sql = ("SELECT turns.* FROM turns_fts JOIN turns ON turns.id = turns_fts.rowid"
+                   " WHERE turns_fts MATCH ?")
+            args.append(words)
+            order = "ORDER BY bm25(turns_fts)"
+        else:
+            sql = "SELECT * FROM turns WHERE content LIKE ?"
+            args.append(f"%{text}%")
+            order = "ORDER BY id DESC"
+        if since is not None:
+            clauses.append("turns.created >= ?" if self.full_text else "created >= ?")
+            args.append(since)
+        if role is not None:
+            clauses.append("turns.role = ?" if self.full_text else "role = ?")
+            args.append(role)
+        sql += "".join(f" AND {clause}" for clause in clauses) + f" {order} LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, args)]
+
+    def Sessions(self):
+        with self._lock:
+            return [dict(row) for row in self._db.execute(
+                "SELECT sessions.*, COUNT(turns.id) AS turns FROM sessions"
+                " LEFT JOIN turns ON turns.session_id = sessions.id GROUP BY sessions.id ORDER BY sessions.id")]
+
+    def Count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+
+# Function to read the token counts from the last chunk of a Groq stream.
+def TokenUsage(chunk):
+    """``{"prompt_tokens", "completion_tokens"}`` when ``chunk`` reports usage, otherwise empty."""
+    usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or getattr(chunk, "usage", None)
+    if usage is None:
+        return {}
+    return {"prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None)}
+
+_store = None
+_store_lock = threading.Lock()
+
+# Function to get the process-wide store, opening it on first use.
+def GetStore():
+    """Open Data/Conversations.db, importing the old chat log the first time it is created."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            is_new = not os.path.exists(DatabasePath)
+            _store = ConversationStore(DatabasePath)
+            if is_new:
+                messages = ReadChatLog()  # Also moves an old ChatLog.json over
+                if messages:
+                    _store.Import(ChatLogPath)
+                    print(f"Imported {len(messages)} messages from {ChatLogPath} into {DatabasePath}")
+        return _store
+
+def main():
+    parser = argparse.ArgumentParser(description="Import, search and export the conversation database.")
+    parser.add_argument("--db", default=DatabasePath)
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="load ChatLog.json or ChatLog.jsonl files, one session each")
+    importer.add_argument("files", nargs="+")
+    search = commands.add_parser("search", help="find turns by their words")
+    search.add_argument("text")
+    search.add_argument("--days", type=float, help="only turns from the last few days")
+    search.add_argument("--limit", type=int, default=20)
+    export = commands.add_parser("export", help="write the history as a JSON-lines chat log")
+    export.add_argument("path", nargs="?", default=ChatLogPath)
+    commands.add_parser("stats", help="sessions and turn counts")
+    args = parser.parse_args()
+
+    store = ConversationStore(args.db)
+    if args.command == "import":
+        for path in args.files:
+            print(f"{path}: {store.Import(path)} messages")
+    elif args.command == "search":
+        since = time.time() - args.days * 86400 if args.days else None
+        for turn in store.Search(args.text, args.limit, since):
+            when = datetime.datetime.fromtimestamp(turn["created"]).strftime("%Y-%m-%d %H:%M")
+            print(f"[{when}] {turn['role']}: {turn['content'][:200]}")
+    elif args.command == "export":
+        RewriteChatLog(store.Messages(), args.path)
+        print(f"Exported {store.Count()} messages to {args.path}")
+    else:
+        for session in store.Sessions():
+            started = datetime.datetime.fromtimestamp(session["started"]).strftime("%Y-%m-%d %H:%M")
+            print(f"#{session['id']} {started} {session['title'] or ''} ({session['turns']} turns)")
+        print(f"{store.Count()} turns")
+    store.Close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import time  # Import time for the monotonic clock.
+
+# Shortest timeout for a streamed answer. The client applies the timeout to
+# every read of the stream, not only to the first token, so a budget that is
+# nearly used up would otherwise cut the answer off mid-sentence.
+MIN_STREAM_TIMEOUT = 10
+
+class DeadlineExceeded(TimeoutError):
+    """Raised by ``Deadline.Check`` once the budget is used up."""
+
+class Deadline:
+    """Latency budget for one query, measured on the monotonic clock.
+
+    Created when the query starts and handed to every backend it reaches.
+    Each stage takes ``Remaining()`` as its timeout, capped by its own limit
+    so the stages after it keep some budget, and falls back to something
+    cheaper when nothing is left: a general answer instead of a decision,
+    an answer without search results, the text without speech. The budget
+    covers the wait for the answer to start; once the model is streaming,
+    the rest of the answer is not cut off.
+    """
+
+    def __init__(self, seconds):
+        self.budget = seconds
+        self.expires = time.monotonic() + seconds
+
+    def Remaining(self, cap=None):
+        """Seconds left, at most ``cap``; never negative."""
+        left = max(0.0, self.expires - time.monotonic())
+        return left if cap is None else min(cap, left)
+
+    def Stage(self, cap):
+        """A deadline for one stage: ``cap`` seconds from now, or this one if it ends sooner."""
+        return Deadline(self.Remaining(cap))
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.expires
+
+    def Check(self, stage="query"):
+        """Raise DeadlineExceeded if the budget is used up."""
+        if self.expired:
+            raise DeadlineExceeded(f"{stage} ran out of its {self.budget:g} s budget")
+
+# Function to turn an optional deadline into a timeout for a blocking call.
+def TimeLeft(deadline, cap=None, minimum=None):
+    """Timeout for a call made under ``deadline``: ``cap`` when there is no deadline.
+
+    ``minimum`` keeps calls that must not fail outright, like an answer that
+    is already due, from getting a zero timeout once the budget is used up.
+    """
+    if deadline is None:
+        return cap
+    left = deadline.Remaining(cap)
+    return left if minimum is None else max(minimum, left)
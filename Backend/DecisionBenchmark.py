@@ -0,0 +1,169 @@
+import argparse  # Import argparse for the command line.
+import json  # Import json to read golden files and write reports.
+import os  # Import os for file path handling.
+import sys  # Import sys to extend the import path when run as a script.
+from collections import Counter  # Import Counter to compare the labels of two decisions.
+
+import numpy as np  # Import NumPy for the latency percentiles.
+
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.Model import ClassifyBatch, SOURCES, funcs
+from Backend.QueryText import NormalizeQuery
+
+# Decision paths that can be compared, by the sources FirstLayerDMMStream may use.
+PATHS = {
+    "remote": ("cohere",),
+    "router": ("router",),
+    "classifier": ("classifier",),
+    "cache": ("cache",),
+    "full": SOURCES,
+}
+
+# Function to read the queries to classify.
+def LoadQueries(path):
+    """One query per line, or the "query" field of each line of a JSON-lines file."""
+    queries = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                query = json.loads(line).get("query")
+                if query:
+                    queries.append(query)
+            else:
+                queries.append(line)
+    return queries
+
+# Function to read the expected decisions, in the format of Data/Decisions.jsonl.
+def LoadGolden(path):
+    """Map each normalized query to its expected list of tasks."""
+    golden = {}
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                golden[NormalizeQuery(record["query"])] = record["decision"]
+    return golden
+
+# Function to find the kind of a task.
+def TaskLabel(task):
+    # Longest first, so "google search" is not read as something shorter.
+    return next((func for func in sorted(funcs, key=len, reverse=True) if task.startswith(func)), None)
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+# Function to summarize one path's results.
+def Score(results, golden=None):
+    """Coverage, errors, retries, latency percentiles, token usage and, with ``golden``, accuracy per label.
+
+    Precision counts the tasks a path produced; recall counts every expected
+    task, so queries a local path declines to decide count as missed.
+    """
+    latencies = [result["latency"] * 1000 for result in results]
+    decided = [result for result in results if result["decision"] is not None]
+    remote = [result for result in results if result["source"] == "cohere"]
+    report = {
+        "queries": len(results),
+        "decided": len(decided),
+        "coverage": len(decided) / len(results) if results else 0.0,
+        "errors": sum(result["error"] is not None for result in results),
+        "retries": sum(max(0, result["attempts"] - 1) for result in results),
+        "retry_seconds": sum(result["retry_seconds"] for result in results),
+        "fallbacks": sum(result["fallback"] for result in results),
+        "sources": dict(Counter(result["source"] for result in decided)),
+        "latency_ms": {
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+            "mean": float(np.mean(latencies)) if latencies else None,
+        },
+        "tokens": {
+            "input": sum(result["input_tokens"] or 0 for result in remote),
+            "output": sum(result["output_tokens"] or 0 for result in remote),
+            "per_query": (sum((result["input_tokens"] or 0) + (result["output_tokens"] or 0) for result in remote)
+                          / len(results)) if results else 0.0,
+        },
+    }
+    if golden is None:
+        return report
+
+    hits, produced, expected = Counter(), Counter(), Counter()
+    exact = judged = 0
+    for result in results:
+        truth = golden.get(NormalizeQuery(result["query"]))
+        if truth is None:
+            continue
+        judged += 1
+        truth_labels = Counter(TaskLabel(task) for task in truth)
+        expected.update(truth_labels)
+        if result["decision"] is None:
+            continue
+        labels = Counter(TaskLabel(task) for task in result["decision"])
+        produced.update(labels)
+        hits.update(labels & truth_labels)
+        exact += [NormalizeQuery(task) for task in result["decision"]] == [NormalizeQuery(task) for task in truth]
+
+    report["judged"] = judged
+    report["exact_match"] = exact / judged if judged else 0.0
+    report["labels"] = {
+        label: {
+            "precision": hits[label] / produced[label] if produced[label] else 0.0,
+            "recall": hits[label] / expected[label] if expected[label] else 0.0,
+            "support": expected[label],
+        }
+        for label in sorted(set(produced) | set(expected), key=str)
+    }
+    return report
+
+# Function to run every path over the same queries.
+def Benchmark(queries, paths=("full",), golden=None, concurrency=4, timeout=None):
+    """Return ``{path: (results, report)}`` for each path, run one after the other."""
+    reports = {}
+    for path in paths:
+        results = ClassifyBatch(queries, PATHS[path], concurrency, timeout)
+        reports[path] = (results, Score(results, golden))
+    return reports
+
+def _format(value, spec):
+    return "-" if value is None else format(value, spec)
+
+# Function to print the paths side by side.
+def PrintComparison(reports):
+    print(f"{'path':<12}{'coverage':>10}{'exact':>8}{'errors':>8}{'retries':>9}{'fallback':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'tokens/q':>10}")
+    for path, (_, report) in reports.items():
+        latency = report["latency_ms"]
+        print(f"{path:<12}{report['coverage']:>10.1%}{_format(report.get('exact_match'), '.1%'):>8}"
+              f"{report['errors']:>8}{report['retries']:>9}{report['fallbacks']:>10}{_format(latency['p50'], '.1f'):>10}{_format(latency['p95'], '.1f'):>10}"
+              f"{_format(latency['p99'], '.1f'):>10}{report['tokens']['per_query']:>10.1f}")
+    for path, (_, report) in reports.items():
+        if report.get("labels"):
+            print(f"\n{path}: precision / recall per label")
+            for label, scores in report["labels"].items():
+                print(f"  {label!s:<16}{scores['precision']:>7.1%} /{scores['recall']:>7.1%}  ({scores['support']})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify a file of queries and compare decision paths.")
+    parser.add_argument("queries", help="queries, one per line, or a JSON-lines file with a \"query\" field")
+    parser.add_argument("--golden", help="expected decisions, JSON lines like Data/Decisions.jsonl")
+    parser.add_argument("--paths", nargs="+", choices=list(PATHS), default=["full"])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--timeout", type=float, help="seconds each query may take")
+    parser.add_argument("--output", help="write every result and report to this JSON file")
+    args = parser.parse_args()
+
+    queries = LoadQueries(args.queries)
+    golden = LoadGolden(args.golden) if args.golden else None
+    reports = Benchmark(queries, args.paths, golden, args.concurrency, args.timeout)
+    PrintComparison(reports)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({path: {"report": report, "results": results} for path, (results, report) in reports.items()},
+                      file, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import json  # Import json to persist the cache.
+import os  # Import os for file path handling and atomic replacement.
+import threading  # Import threading to share the cache between pipelines.
+import time  # Import time for the expiry timestamps.
+from collections import OrderedDict  # Import OrderedDict for least-recently-used order.
+
+from Backend.QueryText import NormalizeQuery
+
+DecisionCachePath = os.path.join("Data", "DecisionCache.json")
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# How long a decision stays valid, by the label of its tasks. A decision with
+# several tasks lives as long as its shortest-lived one; labels with no TTL,
+# like reminders whose task carries a date, are never cached.
+LABEL_TTLS = {
+    "realtime": 5 * MINUTE,
+    "general": DAY,
+    "play": DAY,
+    "generate image": DAY,
+    "content": DAY,
+    "google search": DAY,
+    "youtube search": DAY,
+    "open": 7 * DAY,
+    "close": 7 * DAY,
+    "system": 7 * DAY,
+    "exit": 7 * DAY,
+}
+
+# Function to work out how long a decision may be reused.
+def DecisionTTL(decision):
+    """Seconds ``decision`` may be served from the cache; 0 when it must not be cached."""
+    ttls = []
+    for task in decision:
+        # Longest label first, so "google search" is not read as something shorter.
+        label = next((label for label in sorted(LABEL_TTLS, key=len, reverse=True) if task.startswith(label)), None)
+        if label is None:
+            return 0
+        ttls.append(LABEL_TTLS[label])
+    return min(ttls) if ttls else 0
+
+class DecisionCache:
+    """Bounded LRU cache of decisions keyed on the normalized query.
+
+    "Do you know who is Hariom Gupta?" and "do you know who is hariom gupta"
+    share an entry. Entries expire after the TTL of their labels, and the
+    least recently used one is evicted once ``capacity`` is reached. With a
+    ``path`` the cache is loaded from and saved to that file, so decisions
+    survive a restart; expiry uses wall-clock time for that reason.
+    """
+
+    def __init__(self, capacity=1000, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (decision, expires)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # One save at a time, so saves never share the temporary file.
+        if path:
+            self.Load()
+
+    def Get(self, query):
+        """The cached decision for ``query``, or None."""
+        key = NormalizeQuery(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[0])
+
+    def Put(self, query, decision):
+        """Cache ``decision``; returns False when its labels must not be cached."""
+        ttl = DecisionTTL(decision)
+        if ttl <= 0:
+            return False
+        key = NormalizeQuery(query)
+        if not key:
+            return False
+        with self._lock:
+            self._entries[key] = (list(decision), time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return True
+
+    def Clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def Stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "capacity": self.capacity,
+            }
+
+    def Save(self, path=None):
+        """Write the live entries to ``path`` through a temporary file, in LRU order."""
+        path = path or self.path
+        with self._save_lock:
+            now = time.time()
+            with self._lock:
+                entries = [[key, decision, expires] for key, (decision, expires) in self._entries.items() if expires > now]
+            temp_path = path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(entries, file, ensure_ascii=False)
+            os.replace(temp_path, path)
+
+    def Load(self, path=None):
+        """Read entries saved by ``Save``, skipping expired and malformed ones; a missing or broken file is ignored."""
+        path = path or self.path
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                entries = json.load(file)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            print(f"Decision cache not loaded: {e}")
+            return
+        if not isinstance(entries, list):
+            print("Decision cache not loaded: not a list of entries")
+            return
+        now = time.time()
+        skipped = 0
+        with self._lock:
+            for entry in entries:
+                if not _valid_entry(entry):
+                    skipped += 1
+                    continue
+                key, decision, expires = entry
+                if expires > now:
+                    self._entries[key] = (decision, expires)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        if skipped:
+            print(f"Skipped {skipped} malformed decision cache entries")
+
+def _valid_entry(entry):
+    """True for a ``[key, [task, ...], expires]`` entry as written by ``Save``."""
+    return (isinstance(entry, list) and len(entry) == 3 and isinstance(entry[0], str)
+            and isinstance(entry[1], list) and all(isinstance(task, str) for task in entry[1])
+            and isinstance(entry[2], (int, float)) and not isinstance(entry[2], bool))
@@ -0,0 +1,84 @@
+import threading  # Import threading to guard the subscriber table across threads.
+import traceback  # Import traceback for detailed error information.
+
+# Topics carried on the bus, mapped to the payload type each one accepts.
+STATUS = "status"  # The assistant status line, e.g. "Available..." or "Thinking ...".
+RESPONSE = "response"  # A chat message: {"id", "role", "text", "final"} (see MessageStream).
+MIC = "mic"  # "True" while the microphone is listening, "False" otherwise.
+TEXT_INPUT = "text_input"  # A message typed into the chat box.
+CHAT_TURN = "chat_turn"  # A logged exchange: {"query", "answer", "index"} (see Conversation.AddExchange).
+
+TOPICS = {
+    STATUS: str,
+    RESPONSE: dict,
+    MIC: str,
+    TEXT_INPUT: str,
+    CHAT_TURN: dict,
+}
+
+# Subscribers and the last payload published on every topic.
+_lock = threading.Lock()
+_subscribers = {topic: [] for topic in TOPICS}
+_latest = {}
+
+def _check_topic(topic):
+    if topic not in TOPICS:
+        raise ValueError(f"Unknown event topic: {topic}")
+
+# Function to register a callback for a topic.
+def Subscribe(topic, callback):
+    """Call ``callback(payload)`` for every event published on ``topic``.
+
+    Callbacks run synchronously on the publishing thread, so anything that
+    touches widgets must hop to the Qt thread itself (see ``GUI.EventBridge``).
+    """
+    _check_topic(topic)
+    with _lock:
+        _subscribers[topic].append(callback)
+    return callback
+
+# Function to remove a previously registered callback.
+def Unsubscribe(topic, callback):
+    _check_topic(topic)
+    with _lock:
+        try:
+            _subscribers[topic].remove(callback)
+        except ValueError:
+            pass
+
+# Function to check whether anything in this process listens to a topic.
+def HasSubscribers(topic):
+    _check_topic(topic)
+    with _lock:
+        return bool(_subscribers[topic])
+
+# Function to publish an event to every subscriber of a topic.
+def Publish(topic, payload):
+    """Deliver ``payload`` to the subscribers of ``topic``.
+
+    Returns the number of subscribers the event was handed to, so callers can
+    fall back to file IPC when nothing in this process is listening.
+    """
+    _check_topic(topic)
+    expected = TOPICS[topic]
+    if not isinstance(payload, expected):
+        raise TypeError(f"{topic} events carry {expected.__name__}, got {type(payload).__name__}")
+
+    with _lock:
+        _latest[topic] = payload
+        subscribers = list(_subscribers[topic])
+
+    for callback in subscribers:
+        try:
+            callback(payload)
+        except Exception as e:
+            print(f"Error in {topic} subscriber: {e}")
+            traceback.print_exc()
+
+    return len(subscribers)
+
+# Function to read the last payload published on a topic in this process.
+def GetLatest(topic, default=None):
+    _check_topic(topic)
+    with _lock:
+        return _latest.get(topic, default)
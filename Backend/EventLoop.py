@@ -0,0 +1,62 @@
+import asyncio  # Import asyncio for the shared event loop.
+import concurrent.futures  # Import concurrent.futures for the cross-thread result type.
+import threading  # Import threading to run the loop in the background.
+
+# The process-wide backend loop and the thread running it.
+_loop = None
+_thread = None
+_lock = threading.Lock()
+
+def _run_loop(loop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+# Function to get the shared loop, starting it on first use.
+def GetEventLoop():
+    """Return the backend event loop, running forever on a daemon thread.
+
+    TTS, automation and image coroutines all run here instead of on a fresh
+    loop per call, so clients and connections created inside them can be
+    kept between calls.
+    """
+    global _loop, _thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=_run_loop, args=(_loop,), name="BackendEventLoop", daemon=True)
+            _thread.start()
+        return _loop
+
+# Function to schedule a coroutine on the shared loop from any thread.
+def Submit(coro):
+    """Schedule ``coro`` on the backend loop and return a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, GetEventLoop())
+
+# Function to run a coroutine on the shared loop and wait for its result.
+def RunSync(coro, timeout=None):
+    """Blocking submit-and-wait, the replacement for ``asyncio.run(coro)``.
+
+    Must not be called from the loop thread itself, which would wait on
+    itself forever; code already running on the loop should ``await``.
+    """
+    if threading.current_thread() is _thread:
+        coro.close()
+        raise RuntimeError("RunSync called from the backend event loop thread; await the coroutine instead")
+    future = Submit(coro)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+# Function to stop the shared loop, e.g. at shutdown.
+def StopEventLoop():
+    global _loop, _thread
+    with _lock:
+        if _loop is not None and not _loop.is_closed():
+            _loop.call_soon_threadsafe(_loop.stop)
+            _thread.join(timeout=5)
+            if not _loop.is_running():
+                _loop.close()
+        _loop = None
+        _thread = None
@@ -8,6 +8,15 @@ import traceback
 from dotenv import dotenv_values
 import sys
 
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend import StatusBoard
+from Backend.StatusBoard import WriteBoard, ReadBoard
+from Backend.EventLoop import RunSync
+
+CONFIG_ERROR = 2  # Exit code when the API key or the .env file is missing.
+
 # Load environment variables with error handling
 try:
     env_vars = dotenv_values(".env")
@@ -15,23 +24,23 @@ try:
     if not HuggingFaceAPIKey or HuggingFaceAPIKey == "your_huggingfaceapikey":
         print("Error: HuggingFaceAPIKey not found or not set in .env file")
         print("Please run setup_env.py to configure your API keys")
-        # Write failure status to the data file
-        os.makedirs("Frontend/Files", exist_ok=True)
-        with open(r"Frontend/Files/ImageGeneration.data", "w") as f:
-            f.write("False,API_KEY_MISSING")
-        sys.exit(1)
+        # Write failure status to the status board
+        WriteBoard(StatusBoard.IMAGE_GENERATION, "False,API_KEY_MISSING")
+        sys.exit(CONFIG_ERROR)
 except Exception as e:
     print(f"Error loading .env file: {e}")
-    # Write failure status to the data file
-    os.makedirs("Frontend/Files", exist_ok=True)
-    with open(r"Frontend/Files/ImageGeneration.data", "w") as f:
-        f.write("False,ENV_FILE_ERROR")
-    sys.exit(1)
+    # Write failure status to the status board
+    WriteBoard(StatusBoard.IMAGE_GENERATION, "False,ENV_FILE_ERROR")
+    sys.exit(CONFIG_ERROR)
 
 # API details for the Hugging Face Stable Diffusion model
 API_URL = "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0"
 headers = {"Authorization": f"Bearer {HuggingFaceAPIKey}"}
 
+# One HTTP session for all requests, so the connection to the API is reused
+session = requests.Session()
+session.headers.update(headers)
+
 # Function to extract the image prompt from the decision string
 def extract_image_prompt(decision_string):
     if "generate image" in decision_string:
@@ -78,9 +87,8 @@ async def query(payload, max_retries=3, retry_delay=2):
         try:
             print(f"Sending request to API (attempt {attempt+1}/{max_retries}) with payload: {payload}")
             response = await asyncio.to_thread(
-                requests.post, 
+                session.post, 
                 API_URL, 
-                headers=headers, 
                 json=payload, 
                 timeout=60
             )
@@ -169,9 +177,7 @@ async def generate_images(prompt: str):
 def GenerateImages(prompt: str):
     try:
         print(f"Starting image generation for prompt: '{prompt}'")
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        success = loop.run_until_complete(generate_images(prompt))
+        success = RunSync(generate_images(prompt))
         
         if success:
             print("Images generated successfully, now opening them")
@@ -187,35 +193,30 @@ def GenerateImages(prompt: str):
 # Main loop to check and process image generation requests
 def main():
     print("Image generation service started")
-    
-    try:
-        # Ensure file exists and directory exists
-        os.makedirs("Frontend/Files", exist_ok=True)
-        file_path = r"Frontend/Files/ImageGeneration.data"
-        
-        if not os.path.exists(file_path):
-            with open(file_path, "w") as f:
-                f.write("False,False")
-                print("Created new ImageGeneration.data file")
 
-        # Read the status and prompt from the data file
-        with open(file_path, "r") as f:
-            Data = f.read().strip()
-            print(f"Read from ImageGeneration.data: '{Data}'")
+    # A prompt on the command line is a job of its own (see main.handle_image_generation):
+    # it doesn't touch the shared status board, so jobs running side by side can't mix up prompts.
+    if len(sys.argv) > 1:
+        success = GenerateImages(prompt=" ".join(sys.argv[1:]).strip())
+        sys.exit(0 if success else 1)
+
+    try:
+        # Read the status and prompt from the status board
+        Data, _ = ReadBoard(StatusBoard.IMAGE_GENERATION, "False,False")
+        Data = Data.strip()
+        print(f"Read from status board: '{Data}'")
         
         if not Data or "," not in Data:
-            print("Invalid data format in ImageGeneration.data")
-            with open(file_path, "w") as f:
-                f.write("False,INVALID_FORMAT")
+            print("Invalid data format on the status board")
+            WriteBoard(StatusBoard.IMAGE_GENERATION, "False,INVALID_FORMAT")
             return
 
         try:
             Prompt, Status = Data.split(",", 1)
             print(f"Parsed - Prompt: '{Prompt}', Status: '{Status}'")
         except ValueError:
-            print(f"Invalid data format in ImageGeneration.data: {Data}")
-            with open(file_path, "w") as f:
-                f.write("False,INVALID_FORMAT")
+            print(f"Invalid data format on the status board: {Data}")
+            WriteBoard(StatusBoard.IMAGE_GENERATION, "False,INVALID_FORMAT")
             return
 
         # If the status indicates an image generation request
@@ -223,8 +224,7 @@ def main():
             print(f"Starting image generation for: '{Prompt.strip()}'")
             
             # First update status to processing
-            with open(file_path, "w") as f:
-                f.write(f"{Prompt},PROCESSING")
+            WriteBoard(StatusBoard.IMAGE_GENERATION, Prompt, ",PROCESSING")
             
             success = GenerateImages(prompt=Prompt.strip())
             
@@ -232,8 +232,7 @@ def main():
             status_message = "True" if success else "Failed"
             
             # Reset the status after image generation
-            with open(file_path, "w") as f:
-                f.write(f"{Prompt},{status_message}")
+            WriteBoard(StatusBoard.IMAGE_GENERATION, Prompt, f",{status_message}")
             
             if success:
                 print("Image generation completed successfully")
@@ -247,8 +246,7 @@ def main():
         traceback.print_exc()
         # Write error status
         try:
-            with open(file_path, "w") as f:
-                f.write("False,ERROR")
+            WriteBoard(StatusBoard.IMAGE_GENERATION, "False,ERROR")
         except:
             pass
 
@@ -0,0 +1,150 @@
+import json  # Import json to encode queue records.
+import os  # Import os for file handling.
+import threading  # Import threading to serialise access within a process.
+import time  # Import time to timestamp queued messages.
+
+try:
+    import fcntl  # POSIX advisory locks.
+except ImportError:
+    fcntl = None
+    import msvcrt  # Windows byte-range locks.
+
+QueueDirPath = os.path.join(os.getcwd(), "Frontend", "Files")
+
+class _FileLock:
+    """Cross-process lock on a sidecar file, held for short critical sections."""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        self._file = open(self.path, "a+b")
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+            self._thread_lock.release()
+
+class InputQueue:
+    """Append-only, ordered queue of typed messages with a consumer offset.
+
+    Producers (the GUI) append one JSON line per message and fsync it, so a
+    message is never overwritten by the next one. The consumer (the backend)
+    keeps the byte offset of the next unread record in a separate file that is
+    replaced atomically. ``Take`` commits the offset before handing the
+    message out, so each message is delivered exactly once, in order, even
+    across restarts; messages still queued when the backend stops are picked up
+    on the next start. Once the consumer has caught up the log is truncated,
+    so it never grows past the current backlog.
+    """
+
+    def __init__(self, name="TextInput", directory=QueueDirPath):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.queue")
+        self.offset_path = os.path.join(directory, f"{name}.offset")
+        self._lock = _FileLock(os.path.join(directory, f"{name}.lock"))
+
+    def _read_offset(self):
+        try:
+            with open(self.offset_path, "r", encoding="utf-8") as file:
+                return int(file.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_offset(self, offset):
+        temp_path = self.offset_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(str(offset))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.offset_path)
+
+    def Append(self, text):
+        record = json.dumps({"text": text, "time": time.time()}, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "ab") as file:
+                file.write(record.encode("utf-8"))
+                file.flush()
+                os.fsync(file.fileno())
+        return self.Depth()
+
+    def Take(self):
+        """Return the oldest unread message and mark it consumed, or None."""
+        with self._lock:
+            offset = self._read_offset()
+            try:
+                with open(self.path, "rb") as file:
+                    file.seek(offset)
+                    line = file.readline()
+                    size = os.fstat(file.fileno()).st_size
+            except FileNotFoundError:
+                return None
+
+            if offset > size:
+                # The log was truncated under a stale offset; start over.
+                offset = 0
+                self._write_offset(0)
+                return None
+            if not line.endswith(b"\n"):
+                return None
+
+            offset += len(line)
+            if offset == size:
+                # Caught up: drop the consumed records instead of advancing.
+                with open(self.path, "wb"):
+                    pass
+                self._write_offset(0)
+            else:
+                self._write_offset(offset)
+
+        try:
+            return json.loads(line.decode("utf-8"))["text"]
+        except (ValueError, KeyError) as e:
+            print(f"Skipping unreadable input queue record: {e}")
+            return self.Take()
+
+    def Depth(self):
+        """Number of messages appended but not yet taken."""
+        offset = self._read_offset()
+        try:
+            with open(self.path, "rb") as file:
+                file.seek(offset)
+                return file.read().count(b"\n")
+        except FileNotFoundError:
+            return 0
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def GetInputQueue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = InputQueue()
+    return _queue
+
+def AppendInput(text):
+    return GetInputQueue().Append(text)
+
+def TakeInput():
+    return GetInputQueue().Take()
+
+def InputQueueDepth():
+    return GetInputQueue().Depth()
@@ -0,0 +1,284 @@
+import argparse  # Import argparse for the train/eval command line.
+import json  # Import json to read and write the decision log.
+import os  # Import os for file path handling.
+import re  # Import re to tokenize queries.
+import threading  # Import threading to swap models and count new examples safely.
+import time  # Import time to timestamp logged decisions.
+import zlib  # Import zlib for a hash that is stable across runs.
+
+import numpy as np  # Import NumPy for the vectorizer and the linear model.
+
+DecisionLogPath = os.path.join("Data", "Decisions.jsonl")
+ModelPath = os.path.join("Data", "IntentClassifier.npz")
+
+# Labels the classifier predicts: the decision model's task kinds, plus
+# "multi" for queries the model split into several tasks.
+LABELS = [
+    "general", "realtime", "open", "close", "play", "generate image", "system",
+    "content", "google search", "youtube search", "reminder", "exit", "multi",
+]
+
+# Labels whose decision can be rebuilt from the query alone; anything else is
+# escalated to the decision model even when the classifier is sure.
+SERVABLE = {"general", "realtime", "exit"}
+
+DIMENSIONS = 1 << 16  # Hashed feature space.
+TARGET_PRECISION = 0.95  # Precision required of the predictions served locally.
+RETRAIN_EVERY = 50  # New logged decisions before the model is retrained.
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+# Function to turn a query into hashed feature indices.
+def Features(query):
+    """Word unigrams and bigrams plus the first word, hashed into DIMENSIONS buckets."""
+    words = _TOKEN.findall(query.lower())
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if words:
+        grams.append(f"^{words[0]}")
+    return np.array([zlib.crc32(gram.encode("utf-8")) % DIMENSIONS for gram in grams], dtype=np.int64)
+
+# Function to reduce a logged decision to the label the classifier learns.
+def DecisionLabel(decision):
+    if not decision:
+        return None
+    if len(decision) != 1:
+        return "multi"
+    task = decision[0]
+    # Longest label first, so "google search" wins over "general"-like prefixes.
+    for label in sorted(LABELS, key=len, reverse=True):
+        if task.startswith(label):
+            return label
+    return None
+
+class IntentClassifier:
+    """TF-IDF weighted hashing vectorizer feeding a softmax linear model.
+
+    Rows are kept sparse (feature indices and weights), so training and
+    prediction never build a dense matrix; a prediction is a few dozen row
+    lookups in the weight matrix.
+    """
+
+    def __init__(self, weights=None, bias=None, idf=None, threshold=1.0):
+        self.weights = weights if weights is not None else np.zeros((DIMENSIONS, len(LABELS)), dtype=np.float32)
+        self.bias = bias if bias is not None else np.zeros(len(LABELS), dtype=np.float32)
+        self.idf = idf if idf is not None else np.ones(DIMENSIONS, dtype=np.float32)
+        self.threshold = threshold  # Confidence needed to answer without the decision model.
+
+    def _vector(self, query):
+        indices, counts = np.unique(Features(query), return_counts=True)
+        values = counts * self.idf[indices]
+        norm = np.sqrt((values * values).sum())
+        return indices, (values / norm if norm else values).astype(np.float32)
+
+    def Probabilities(self, query):
+        indices, values = self._vector(query)
+        logits = values @ self.weights[indices] + self.bias
+        logits = np.exp(logits - logits.max())
+        return logits / logits.sum()
+
+    def Predict(self, query):
+        """Return ``(label, confidence)``."""
+        probabilities = self.Probabilities(query)
+        best = int(probabilities.argmax())
+        return LABELS[best], float(probabilities[best])
+
+    def Fit(self, queries, labels, epochs=30, learning_rate=0.5, l2=1e-5, batch_size=64, seed=0):
+        """Train on ``queries`` with their ``labels`` by minibatch gradient descent."""
+        rng = np.random.default_rng(seed)
+        targets = np.array([LABELS.index(label) for label in labels])
+
+        # Inverse document frequency over the training queries.
+        document_frequency = np.zeros(DIMENSIONS, dtype=np.float32)
+        for query in queries:
+            document_frequency[np.unique(Features(query))] += 1
+        self.idf = (np.log((1 + len(queries)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        rows = [self._vector(query) for query in queries]
+        self.weights[:] = 0
+        self.bias[:] = 0
+        for _ in range(epochs):
+            order = rng.permutation(len(rows))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                row_ids = np.concatenate([np.full(len(rows[i][0]), n) for n, i in enumerate(batch)])
+                columns = np.concatenate([rows[i][0] for i in batch])
+                values = np.concatenate([rows[i][1] for i in batch])
+
+                logits = np.zeros((len(batch), len(LABELS)), dtype=np.float32)
+                np.add.at(logits, row_ids, self.weights[columns] * values[:, None])
+                logits += self.bias
+                logits = np.exp(logits - logits.max(axis=1, keepdims=True))
+                gradient = logits / logits.sum(axis=1, keepdims=True)
+                gradient[np.arange(len(batch)), targets[batch]] -= 1
+                gradient /= len(batch)
+
+                touched = np.unique(columns)
+                self.weights[touched] *= 1 - learning_rate * l2
+                np.add.at(self.weights, columns, -learning_rate * gradient[row_ids] * values[:, None])
+                self.bias -= learning_rate * gradient.sum(axis=0)
+        return self
+
+    def Calibrate(self, queries, labels, target=TARGET_PRECISION):
+        """Pick the lowest threshold at which servable predictions reach ``target`` precision."""
+        scored = []
+        for query, label in zip(queries, labels):
+            predicted, confidence = self.Predict(query)
+            if predicted in SERVABLE:
+                scored.append((confidence, predicted == label))
+        scored.sort(reverse=True)
+
+        self.threshold, correct = 1.0, 0
+        for served, (confidence, right) in enumerate(scored, 1):
+            correct += right
+            if correct / served >= target:
+                self.threshold = confidence
+        return self.threshold
+
+    def Save(self, path=ModelPath):
+        temp_path = path + ".tmp.npz"
+        np.savez_compressed(temp_path, weights=self.weights, bias=self.bias, idf=self.idf,
+                            threshold=np.float32(self.threshold), labels=np.array(LABELS))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def Load(cls, path=ModelPath):
+        with np.load(path) as data:
+            if list(data["labels"]) != LABELS:
+                raise ValueError("Model was trained on a different label set")
+            return cls(data["weights"], data["bias"], data["idf"], float(data["threshold"]))
+
+# Function to read (query, label) pairs from a decision log.
+def LoadExamples(path=DecisionLogPath):
+    queries, labels = [], []
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                label = DecisionLabel(record.get("decision", []))
+                if label is not None and record.get("query"):
+                    queries.append(record["query"])
+                    labels.append(label)
+    except FileNotFoundError:
+        pass
+    return queries, labels
+
+def _split(queries, labels, holdout, seed=0):
+    order = np.random.default_rng(seed).permutation(len(queries))
+    cut = int(len(order) * (1 - holdout))
+    pick = lambda items, idx: [items[i] for i in idx]
+    return (pick(queries, order[:cut]), pick(labels, order[:cut]),
+            pick(queries, order[cut:]), pick(labels, order[cut:]))
+
+# Function to train, calibrate and save a model from the decision log.
+def Train(path=DecisionLogPath, model_path=ModelPath, holdout=0.2):
+    """Fit on the log minus a holdout split, which sets the confidence threshold."""
+    queries, labels = LoadExamples(path)
+    if len(queries) < 20:
+        raise ValueError(f"Need at least 20 logged decisions to train, found {len(queries)}")
+    train_q, train_l, held_q, held_l = _split(queries, labels, holdout)
+    model = IntentClassifier().Fit(train_q, train_l)
+    model.Calibrate(held_q, held_l)
+    model.Save(model_path)
+    return model, held_q, held_l
+
+# Function to measure a model on labelled queries.
+def Evaluate(model, queries, labels):
+    """Accuracy, the share served locally, the precision of what was served, and per-label precision/recall."""
+    predictions = [model.Predict(query) for query in queries]
+    served = [(p, l) for (p, c), l in zip(predictions, labels) if p in SERVABLE and c >= model.threshold]
+    report = {
+        "examples": len(queries),
+        "accuracy": float(np.mean([p == l for (p, _), l in zip(predictions, labels)])) if queries else 0.0,
+        "local_share": len(served) / len(queries) if queries else 0.0,
+        "served_precision": float(np.mean([p == l for p, l in served])) if served else 0.0,
+        "threshold": model.threshold,
+        "labels": {},
+    }
+    for label in LABELS:
+        predicted = sum(p == label for p, _ in predictions)
+        actual = labels.count(label)
+        hits = sum(p == label and l == label for (p, _), l in zip(predictions, labels))
+        if predicted or actual:
+            report["labels"][label] = {
+                "precision": hits / predicted if predicted else 0.0,
+                "recall": hits / actual if actual else 0.0,
+                "support": actual,
+            }
+    return report
+
+_model = None
+_model_lock = threading.Lock()
+_model_loaded = False
+_new_examples = 0
+
+def _current_model():
+    global _model, _model_loaded
+    with _model_lock:
+        if not _model_loaded:
+            _model_loaded = True
+            try:
+                _model = IntentClassifier.Load()
+            except (FileNotFoundError, ValueError, KeyError) as e:
+                print(f"Intent classifier not loaded: {e}")
+        return _model
+
+# Function used in front of the decision model.
+def ClassifyLocally(query):
+    """The decision for ``query`` when the classifier is confident, otherwise None."""
+    model = _current_model()
+    if model is None:
+        return None
+    label, confidence = model.Predict(query)
+    if label not in SERVABLE or confidence < model.threshold:
+        return None
+    return ["exit"] if label == "exit" else [f"{label} {query.strip()}"]
+
+# Function to log a decision accepted from the decision model.
+def RecordDecision(query, decision, path=DecisionLogPath):
+    """Append the pair to the training log; returns True when it is time to retrain."""
+    global _new_examples
+    record = json.dumps({"query": query, "decision": decision, "time": time.time()}, ensure_ascii=False)
+    with _model_lock:
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(record + "\n")
+        _new_examples += 1
+        if _new_examples < RETRAIN_EVERY:
+            return False
+        _new_examples = 0
+        return True
+
+# Function to retrain from the log and start serving the new model.
+def Retrain():
+    global _model, _model_loaded
+    model, held_q, held_l = Train()
+    with _model_lock:
+        _model, _model_loaded = model, True
+    report = Evaluate(model, held_q, held_l)
+    print(f"Intent classifier retrained: {report['local_share']:.0%} served locally "
+          f"at {report['served_precision']:.0%} precision (threshold {model.threshold:.2f})")
+    return model
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or evaluate the local intent classifier.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train = commands.add_parser("train", help="train on the decision log and calibrate on a holdout split")
+    train.add_argument("--log", default=DecisionLogPath)
+    train.add_argument("--model", default=ModelPath)
+    train.add_argument("--holdout", type=float, default=0.2)
+    evaluate = commands.add_parser("eval", help="evaluate a saved model on a held-out decision log")
+    evaluate.add_argument("log")
+    evaluate.add_argument("--model", default=ModelPath)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        model, held_q, held_l = Train(args.log, args.model, args.holdout)
+        print(json.dumps(Evaluate(model, held_q, held_l), indent=2))
+    else:
+        queries, labels = LoadExamples(args.log)
+        print(json.dumps(Evaluate(IntentClassifier.Load(args.model), queries, labels), indent=2))
+
+if __name__ == "__main__":
+    main()
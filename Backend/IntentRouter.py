@@ -0,0 +1,207 @@
+import json  # Import json to read the list of installed apps.
+import os  # Import os for file path handling.
+import re  # Import re to split multi-command phrases.
+import string  # Import string for the punctuation stripped from queries.
+import threading  # Import threading to load the app names once.
+
+AppNamesPath = os.path.join("Data", "app_names.json")
+
+# Confidence a route needs before the decision model is skipped.
+MIN_CONFIDENCE = 0.8
+
+# Confidence of each kind of match.
+CERTAIN = 1.0  # Fixed phrases and known apps: "mute", "open notepad".
+FREE_TEXT = 0.9  # A command verb followed by free text: "play let her go".
+
+# Websites "open" and "close" may target besides installed apps.
+KNOWN_SITES = {
+    "facebook", "instagram", "youtube", "google", "gmail", "whatsapp", "telegram", "twitter",
+    "linkedin", "github", "chatgpt", "netflix", "amazon", "spotify", "reddit", "wikipedia",
+}
+
+# Vendor words users leave out: "chrome" for "google chrome", "edge" for "microsoft edge".
+VENDORS = {"google", "microsoft", "adobe", "oracle"}
+
+# Politeness and wake words that don't change what is asked.
+FILLER = {"please", "jarvis", "kindly", "hey", "ok", "okay"}
+LEADING_FILLER = ("can you ", "could you ", "would you ", "will you ", "i want you to ", "i want to ")
+
+# Command phrases mapped to (label, what follows). Labels are the decision
+# model's task prefixes; "what follows" is "app", "text" or None for a phrase
+# that is the whole command.
+COMMANDS = {
+    "open": ("open", "app"),
+    "launch": ("open", "app"),
+    "start": ("open", "app"),
+    "close": ("close", "app"),
+    "quit": ("close", "app"),
+    "exit": ("exit", None),
+    "play": ("play", "text"),
+    "google search": ("google search", "text"),
+    "search google for": ("google search", "text"),
+    "youtube search": ("youtube search", "text"),
+    "search youtube for": ("youtube search", "text"),
+    "generate image": ("generate image", "text"),
+    "generate an image of": ("generate image", "text"),
+    "generate image of": ("generate image", "text"),
+    "create an image of": ("generate image", "text"),
+    "write": ("content", "text"),
+    "mute": ("system mute", None),
+    "unmute": ("system unmute", None),
+    "volume up": ("system volume up", None),
+    "volume down": ("system volume down", None),
+    "increase volume": ("system volume up", None),
+    "increase the volume": ("system volume up", None),
+    "turn up the volume": ("system volume up", None),
+    "decrease volume": ("system volume down", None),
+    "decrease the volume": ("system volume down", None),
+    "turn down the volume": ("system volume down", None),
+    "bye": ("exit", None),
+    "goodbye": ("exit", None),
+    "good bye": ("exit", None),
+}
+
+# Words that make free text look like a question or a chat rather than a command.
+CHAT_WORDS = {"me", "us", "you", "your", "game", "what", "who", "why", "how", "when", "where"}
+
+# Words separating the commands of a multi-command phrase.
+SEPARATORS = re.compile(r"\s*(?:,|\band then\b|\bthen\b|\band also\b|\balso\b|\band\b)\s*")
+
+_PUNCTUATION = str.maketrans({c: " " for c in string.punctuation if c not in "&-"})
+
+class KeywordTrie:
+    """Token trie mapping command phrases to values, matched longest first."""
+
+    def __init__(self, phrases=None):
+        self.root = {}
+        for phrase, value in (phrases or {}).items():
+            self.Add(phrase, value)
+
+    def Add(self, phrase, value):
+        node = self.root
+        for token in phrase.split():
+            node = node.setdefault(token, {})
+        node[None] = value
+
+    def Match(self, tokens):
+        """Return ``(value, length)`` for the longest phrase that starts ``tokens``."""
+        node, found = self.root, (None, 0)
+        for i, token in enumerate(tokens):
+            node = node.get(token)
+            if node is None:
+                break
+            if None in node:
+                found = (node[None], i + 1)
+        return found
+
+_trie = KeywordTrie(COMMANDS)
+_apps = None
+_apps_lock = threading.Lock()
+
+# Function to load the names "open" and "close" can be sure about.
+def KnownApps():
+    """Installed app names from Data/app_names.json, short aliases and known websites."""
+    global _apps
+    with _apps_lock:
+        if _apps is None:
+            try:
+                with open(AppNamesPath, "r", encoding="utf-8") as file:
+                    names = {name.strip().lower() for name in json.load(file) if name.strip()}
+            except (FileNotFoundError, ValueError) as e:
+                print(f"App names not loaded: {e}")
+                names = set()
+            aliases = {name.split(" ", 1)[1] for name in names if name.split(" ", 1)[0] in VENDORS and " " in name}
+            _apps = names | aliases | KNOWN_SITES
+        return _apps
+
+# Function to normalize a query before it is routed.
+def NormalizeCommand(query):
+    text = query.lower().translate(_PUNCTUATION)
+    text = " ".join(word for word in text.split() if word not in FILLER)
+    for filler in LEADING_FILLER:
+        if text.startswith(filler):
+            text = text[len(filler):]
+    return text
+
+def _strip_app(target):
+    """Drop words around an app name: "the", "app", "application"."""
+    words = target.split()
+    if words and words[0] == "the":
+        words = words[1:]
+    if words and words[-1] in ("app", "application"):
+        words = words[:-1]
+    return " ".join(words)
+
+def _route_clause(clause, previous):
+    """Route one command; returns ``(task, confidence, label)``."""
+    tokens = clause.split()
+    match, length = _trie.Match(tokens)
+    label, follows = match or (None, None)
+    rest = " ".join(tokens[length:])
+
+    if label is None:
+        # "open chrome and firefox": the verb carries over to a bare app name
+        if previous in ("open", "close") and _strip_app(clause) in KnownApps():
+            return f"{previous} {_strip_app(clause)}", CERTAIN, previous
+        return None, 0.0, None
+
+    if follows is None:
+        return (label, CERTAIN, label) if not rest else (None, 0.0, None)
+
+    if follows == "app":
+        app = _strip_app(rest)
+        return (f"{label} {app}", CERTAIN, label) if app in KnownApps() else (None, 0.0, None)
+
+    # Free text after the command
+    if label == "generate image" and rest.startswith("of "):
+        rest = rest[3:]
+    if label == "content":
+        rest = re.sub(r"^(?:a|an|the)\s+", "", rest)
+    if not rest or CHAT_WORDS.intersection(rest.split()):
+        return None, 0.0, None
+    return f"{label} {rest}", FREE_TEXT, label
+
+# Function to route a query without the decision model.
+def RouteCommand(query):
+    """Return ``(tasks, confidence)`` for a query made only of commands.
+
+    ``tasks`` is in the decision model's format, e.g. ``["open chrome",
+    "system volume up"]``. A phrase is split on commas, "and", "then" and
+    "also", and every part has to be a command on its own for the route to
+    count; the confidence is that of the least certain part. Questions and
+    anything else it can't place give ``([], 0.0)``. So does an exit next to
+    other commands ("play hello, goodbye"): quitting is only routed when it
+    is the whole utterance, and otherwise left to the decision model.
+    """
+    text = NormalizeCommand(query)
+    if not text:
+        return [], 0.0
+
+    tasks, confidence, previous = [], CERTAIN, None
+    for clause in (part for part in SEPARATORS.split(text) if part):
+        task, score, label = _route_clause(clause, previous)
+        if (task is None and tasks and previous in ("play", "google search", "youtube search", "content", "generate image")
+                and not CHAT_WORDS.intersection(clause.split())):
+            # "play salt and pepper": the separator was part of the free text
+            tasks[-1] = f"{tasks[-1]} and {clause}"
+            continue
+        if task is None:
+            return [], 0.0
+        tasks.append(task)
+        confidence = min(confidence, score)
+        previous = label
+    if "exit" in tasks and len(tasks) > 1:
+        return [], 0.0
+    return tasks, confidence
+
+# Function used in front of the decision model.
+def RouteLocally(query, min_confidence=MIN_CONFIDENCE):
+    """The routed tasks when the router is confident enough, otherwise None."""
+    tasks, confidence = RouteCommand(query)
+    if tasks and confidence >= min_confidence:
+        return tasks
+    return None
+
+if __name__ == "__main__":
+    while True:
+        print(RouteCommand(input(">>> ")))
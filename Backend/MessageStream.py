@@ -0,0 +1,78 @@
+import json  # Import json to encode messages as JSON lines.
+import os  # Import os for file handling.
+import threading  # Import threading to allocate message ids safely.
+
+from Backend.EventBus import Publish, RESPONSE
+
+# Roles a message can have.
+USER = "user"
+ASSISTANT = "assistant"
+
+StreamPath = os.path.join(os.getcwd(), "Frontend", "Files", "Responses.jsonl")
+
+_lock = threading.Lock()
+_next_id = 1
+
+# Function to start a fresh conversation view.
+def ClearMessages():
+    """Reset message ids and truncate the stream file.
+
+    An out-of-process GUI notices the truncation and drops its bubbles.
+    """
+    global _next_id
+    with _lock:
+        _next_id = 1
+        os.makedirs(os.path.dirname(StreamPath), exist_ok=True)
+        with open(StreamPath, "w", encoding="utf-8"):
+            pass
+
+# Function to send a new message, or a new version of an existing one, to the GUI.
+def EmitMessage(role, text, final=True, message_id=None):
+    """Show ``text`` as a chat message and return its id.
+
+    Pass the id of an earlier message to replace its text, e.g. while an
+    answer is still streaming in with ``final=False``. Messages go to the
+    in-process GUI over the event bus; when nothing is subscribed they are
+    appended to ``Responses.jsonl`` as one JSON object per line.
+    """
+    global _next_id
+    with _lock:
+        if message_id is None:
+            message_id = _next_id
+            _next_id += 1
+
+    message = {"id": message_id, "role": role, "text": text, "final": final}
+    if not Publish(RESPONSE, message):
+        line = json.dumps(message, ensure_ascii=False) + "\n"
+        with _lock:
+            with open(StreamPath, "a", encoding="utf-8") as file:
+                file.write(line)
+    return message_id
+
+# Function to read the messages appended to the stream file since an offset.
+def ReadMessages(offset=0):
+    """Return ``(messages, offset, reset)`` for the records after ``offset``.
+
+    ``reset`` is True when the file was truncated since the last read, in which
+    case ``messages`` holds the whole new stream. Later records for an id
+    supersede earlier ones.
+    """
+    reset = False
+    try:
+        with open(StreamPath, "rb") as file:
+            if os.fstat(file.fileno()).st_size < offset:
+                offset, reset = 0, True
+            file.seek(offset)
+            data = file.read()
+    except FileNotFoundError:
+        return [], 0, offset > 0
+
+    # Leave a trailing partial line for the next read.
+    end = data.rfind(b"\n") + 1
+    messages = []
+    for line in data[:end].splitlines():
+        try:
+            messages.append(json.loads(line.decode("utf-8")))
+        except ValueError:
+            continue
+    return messages, offset + end, reset
@@ -1,6 +1,22 @@
 import cohere  # Import the Cohere library for AI services.
 from rich import print  # Import the Rich library to enhance terminal outputs.
 from dotenv import dotenv_values  # Import dotenv to load environment variables.
+import math  # Import math to round timeouts up to whole seconds.
+import os  # Import os for file path handling.
+import re  # Import re to find placeholders the model echoed.
+import sys  # Import sys to extend the import path when run as a script.
+import time  # Import time to wait before retrying.
+from concurrent.futures import ThreadPoolExecutor  # Import ThreadPoolExecutor to bound batch concurrency.
+from time import perf_counter  # Import perf_counter to time queries and retries.
+
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.Deadline import Deadline, DeadlineExceeded, TimeLeft
+from Backend.DecisionCache import DecisionCache, DecisionCachePath
+from Backend.IntentRouter import RouteLocally
+from Backend.IntentClassifier import ClassifyLocally, RecordDecision, Retrain
+from Backend.Scheduler import SubmitBackground
 
 # Load environment variables from the .env file.
 env_vars = dotenv_values(".env")
@@ -11,6 +27,13 @@ CohereAPIKey = env_vars.get("CohereAPIKey")
 # Create a Cohere client using the provided API key.
 co = cohere.Client(api_key=CohereAPIKey)
 
+# Cache of Cohere's decisions, kept across restarts unless PersistDecisionCache=False.
+PersistDecisionCache = env_vars.get("PersistDecisionCache", "True").lower() == "true"
+decision_cache = DecisionCache(
+    capacity=int(env_vars.get("DecisionCacheSize", 1000)),
+    path=DecisionCachePath if PersistDecisionCache else None,
+)
+
 # Define a list of recognized function keywords for task categorization.
 funcs = [
     "exit", "general", "realtime", "open", "close", "play",
@@ -65,54 +88,229 @@ ChatHistory = [
     {"role": "Chatbot", "message": "general chat with me."}
 ]
 
-# Define the main function for decision-making on queries.
-def FirstLayerDMM(prompt: str = "test"):
-    # Add the user's query to the messages list.
-    messages.append({"role": "user", "content": f"{prompt}"})
+# How many decisions came from each source: the local router, the cache, the local classifier or Cohere.
+DecisionSources = {"router": 0, "cache": 0, "classifier": 0, "cohere": 0}
+
+# The sources FirstLayerDMMStream tries, in order.
+SOURCES = ("router", "cache", "classifier", "cohere")
+
+# Retry policy for the Cohere call. Decoding is deterministic, so a reply that
+# parses to nothing would come back the same; only failed requests are retried.
+MAX_ATTEMPTS = 3  # Requests per query, the first one included.
+RETRY_DELAY = 0.2  # Seconds before the first retry, doubled for each one after it.
+
+# Retries and fallbacks since startup, and the time the retries added.
+DecisionRetries = {"retries": 0, "fallbacks": 0, "retry_seconds": 0.0}
+
+# Placeholders from the preamble the model sometimes echoes instead of filling in.
+PLACEHOLDER = re.compile(r"\((?:query|application name[^)]*|song name|image prompt|task name|topic)\)")
+
+class DecisionParser:
+    """Split the decision model's reply into tasks while it is still streaming.
+
+    A task is complete once the comma after it, or the end of the reply,
+    has arrived. Text that doesn't start with one of ``funcs`` is dropped. A
+    task that echoes the "(query)" placeholder gets the original prompt in
+    its place; one that echoes any other placeholder, like "open (application
+    name)", can't be rebuilt and is dropped.
+    """
+
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self._pending = ""
+
+    def Feed(self, text):
+        """Take the next piece of the reply; returns the tasks it completed."""
+        self._pending += text.replace("\n", "")
+        *done, self._pending = self._pending.split(",")
+        return [task for task in map(self._task, done) if task]
+
+    def Finish(self):
+        """The last task, once the reply has ended."""
+        task = self._task(self._pending)
+        self._pending = ""
+        return [task] if task else []
+
+    def _task(self, text):
+        task = text.strip()
+        if not any(task.startswith(func) for func in funcs):
+            return None
+        if "(query)" in task:
+            task = task.replace("(query)", self.prompt.strip())
+        if PLACEHOLDER.search(task):
+            return None
+        return " ".join(task.split())
+
+# Function to make one request to the decision model.
+def _CohereDecision(prompt, deadline, stats, cancel=None):
+    """Yield the tasks of one Cohere reply as they complete; see DecisionParser.
+
+    Stops reading when ``cancel`` fires, and closes the stream however it
+    ends, so a cancelled or abandoned request doesn't keep its connection.
+    """
+    # Limit the request to what is left of the query's budget.
+    request_options = None
+    if deadline is not None:
+        request_options = {"timeout_in_seconds": max(1, math.ceil(deadline.Remaining()))}
 
     # Create a streaming chat session with the Cohere model.
     stream = co.chat_stream(
         model='command-r-plus',  # Specify the Cohere model to use.
         message=prompt,  # Pass the user's query.
-        temperature=0.7,  # Set the creativity level of the model.
+        temperature=0,  # Decide the same way every time.
         chat_history=ChatHistory,  # Provide the predefined chat history for context.
         prompt_truncation='OFF',  # Ensure the prompt is not truncated.
         connectors=[],  # No additional connectors are used.
-        preamble=preamble  # Pass the detailed instruction preamble.
+        preamble=preamble,  # Pass the detailed instruction preamble.
+        request_options=request_options
+    )
+
+    # Hand on each task as soon as the comma after it arrives.
+    parser = DecisionParser(prompt)
+    try:
+        for event in stream:
+            if cancel is not None and cancel.cancelled:
+                return
+            if event.event_type == "text-generation":
+                yield from parser.Feed(event.text)
+            elif event.event_type == "stream-end":
+                units = getattr(getattr(event.response, "meta", None), "billed_units", None)
+                stats["input_tokens"] = getattr(units, "input_tokens", None)
+                stats["output_tokens"] = getattr(units, "output_tokens", None)
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceeded("Decision making ran out of time")
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    yield from parser.Finish()
+
+# Define the main function for decision-making on queries.
+def FirstLayerDMMStream(prompt: str = "test", deadline=None, sources=SOURCES, learn=True, stats=None, cancel=None):
+    """Yield the tasks of the decision for ``prompt`` as soon as each one is complete.
+
+    Plain commands ("open chrome", "volume up") are routed locally, repeated
+    queries are answered from the decision cache, and queries the local
+    classifier is confident about are answered by it; only the rest go to
+    Cohere, whose reply is parsed while it streams so the first task can be
+    started before the model has finished. Cohere's decisions are cached and
+    logged to train the classifier unless ``learn`` is False.
+
+    A failed Cohere request is retried up to MAX_ATTEMPTS times within
+    ``deadline``. When Cohere can't decide, the query is treated as
+    ``general <query>``, so at least one task is always yielded once Cohere
+    has been asked. Once ``cancel`` fires, Cohere's stream is closed and
+    nothing more is yielded, retried or learned.
+
+    ``sources`` limits which of the above are tried; when none of them can
+    decide, nothing is yielded. ``stats``, if given, is a dict that receives
+    the source that decided, the tokens Cohere used, the number of attempts,
+    the seconds the retries added and whether the fallback was used.
+    """
+    stats = {} if stats is None else stats
+    cancelled = lambda: cancel is not None and cancel.cancelled
+    local = (
+        ("router", lambda: RouteLocally(prompt)),
+        ("cache", lambda: decision_cache.Get(prompt)),
+        ("classifier", lambda: ClassifyLocally(prompt)),
     )
+    for source, decide in local:
+        if source in sources:
+            decision = decide()
+            if decision is not None:
+                DecisionSources[source] += 1
+                stats["source"] = source
+                yield from decision
+                return
+
+    if "cohere" not in sources:
+        return
+
+    # Add the user's query to the messages list.
+    messages.append({"role": "user", "content": f"{prompt}"})
+    DecisionSources["cohere"] += 1
+    stats["source"] = "cohere"
 
-    # Initialize an empty string to store the generated response.
-    response = ""
+    response = []
+    complete = False
+    first_failure = None
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        if cancelled():
+            break
+        if deadline is not None and deadline.expired:
+            print("Decision making ran out of time")
+            break
+        stats["attempts"] = attempt
+        decision = _CohereDecision(prompt, deadline, stats, cancel)
+        try:
+            for task in decision:
+                response.append(task)
+                yield task
+            complete = not cancelled()
+            break
+        except DeadlineExceeded as e:
+            print(f"{e}")
+            break
+        except Exception as e:
+            if cancelled():
+                break  # The stream was closed under the reader
+            print(f"Decision request {attempt} of {MAX_ATTEMPTS} failed: {e}")
+            if response:
+                break  # Tasks already handed on can't be taken back
+            first_failure = first_failure or perf_counter()
+            if attempt < MAX_ATTEMPTS:
+                DecisionRetries["retries"] += 1
+                time.sleep(min(RETRY_DELAY * 2 ** (attempt - 1), TimeLeft(deadline, RETRY_DELAY * 4)))
+        finally:
+            decision.close()  # Also when the consumer closes this generator early
 
-    # Iterate over events in the stream and capture text generation events.
-    for event in stream:
-        if event.event_type == "text-generation":
-            response += event.text  # Append generated text to the response.
+    if first_failure is not None:
+        stats["retry_seconds"] = perf_counter() - first_failure
+        DecisionRetries["retry_seconds"] += stats["retry_seconds"]
 
-    # Remove newline characters and split responses into individual tasks.
-    response = response.replace("\n", "")
-    response = response.split(",")
+    if not response and not cancelled():
+        # Cohere gave nothing usable: answer it as a general question.
+        DecisionRetries["fallbacks"] += 1
+        stats["fallback"] = True
+        yield f"general {prompt.strip()}"
+        return
 
-    # Strip leading and trailing whitespaces from each task.
-    response = [i.strip() for i in response]
+    if complete and learn:
+        if decision_cache.Put(prompt, response) and decision_cache.path:
+            SubmitBackground(decision_cache.Save, name="saving the decision cache")
+        if RecordDecision(prompt, response):
+            SubmitBackground(Retrain, name="retraining the intent classifier")
 
-    # Initialize an empty list to filter valid tasks.
-    temp = []
+# Function to get the whole decision at once.
+def FirstLayerDMM(prompt: str = "test", deadline=None):
+    """Classify the query into a list of tasks, see FirstLayerDMMStream."""
+    return list(FirstLayerDMMStream(prompt, deadline))
 
-    # Filter the tasks based on recognized function keywords.
-    for task in response:
-        for func in funcs:
-            if task.startswith(func):
-                temp.append(task)  # Add valid tasks to the filtered list.
+# Function to classify many queries at once, e.g. for a benchmark.
+def ClassifyBatch(queries, sources=SOURCES, concurrency=4, timeout=None, learn=False):
+    """Classify ``queries`` with at most ``concurrency`` in flight; results keep the input order.
 
-    # Update the response with the filtered list of tasks.
-    response = temp
+    Each result is a dict with the query, its decision (None when the sources
+    could not decide), the source that decided, the latency in seconds, the
+    tokens Cohere used, the Cohere attempts and retry time, whether the
+    general fallback was used and the error, if any. ``timeout`` gives every query
+    its own deadline. By default nothing is cached or logged.
+    """
+    def classify(query):
+        stats = {"query": query, "decision": None, "source": None, "input_tokens": None,
+                 "output_tokens": None, "attempts": 0, "retry_seconds": 0.0, "fallback": False, "error": None}
+        start = perf_counter()
+        try:
+            deadline = Deadline(timeout) if timeout else None
+            decision = list(FirstLayerDMMStream(query, deadline, sources, learn, stats))
+            stats["decision"] = decision if stats["source"] else None
+        except Exception as e:
+            stats["error"] = f"{type(e).__name__}: {e}"
+        stats["latency"] = perf_counter() - start
+        return stats
 
-    # If '(query)' is in the response, recursively call the function for further clarification.
-    if any("(query)" in task for task in response):
-        return FirstLayerDMM(prompt=prompt)
-    else:
-        return response  # Return the filtered response.
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(classify, queries))
 
 # Entry point for the script.
 if __name__ == "__main__":
@@ -0,0 +1,247 @@
+import asyncio  # Import asyncio for the stage queues and tasks.
+import random  # Import random to pick the "rest is on screen" notice.
+import threading  # Import threading to let other threads wait for speech to finish.
+import traceback  # Import traceback for detailed error information.
+from contextlib import contextmanager  # Import contextmanager for the stage timer.
+from time import perf_counter  # Import perf_counter to time the stages.
+
+from Backend.textToSpeech import LongAnswerResponses
+from Backend.Cancellation import CancelToken
+from Backend.QueryText import NormalizeQuery
+
+END = object()  # Marks the end of a stage queue.
+
+# Bounded queue sizes between stages.
+CHUNK_QUEUE_SIZE = 64  # generate -> render: text chunks from the model.
+SPEECH_QUEUE_SIZE = 4  # render -> speak: at most two sentences, the rest, the end marker.
+
+class QueryContext:
+    """State handed from stage to stage while one query runs through the pipeline."""
+
+    def __init__(self, query, cancel=None, deadline=None):
+        self.query = query
+        self.cancel = cancel or CancelToken()  # Fired when new input interrupts this query.
+        self.deadline = deadline  # Latency budget shared by every stage, or None.
+        self.interrupted = False
+        self.decision = []
+        self.answer = ""
+        self.ok = True
+        self.exit_requested = False
+        self.timings = {}
+        self.started = perf_counter()
+        self.speech_task = None  # The speak stage task, see Speaker.Start.
+
+    @contextmanager
+    def stage(self, name):
+        """Record how long the enclosed stage took under ``name``."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + perf_counter() - start
+
+    def mark(self, name):
+        """Record the time from the start of the query to this point."""
+        self.timings.setdefault(name, perf_counter() - self.started)
+
+    def report(self):
+        return ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.timings.items())
+
+# Function to feed a blocking iterator into an asyncio queue from a worker thread.
+async def PumpIterator(make_iterator, out_queue, stop=None):
+    """Run ``make_iterator()`` in a thread and put its items on ``out_queue``.
+
+    The queue is bounded, so a slow consumer holds the producer back. An
+    exception raised by the iterator is put on the queue in place of an item,
+    and ``END`` always follows. Setting the ``stop`` event makes the pump
+    close the iterator before it is asked for another item; an event set
+    before the pump starts means the iterator is never advanced at all.
+    """
+    loop = asyncio.get_running_loop()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(out_queue.put(item), loop).result()
+
+    def stopped():
+        return stop is not None and stop.is_set()
+
+    def pump():
+        iterator = None
+        try:
+            if stopped():
+                return
+            iterator = make_iterator()
+            while not stopped():
+                item = next(iterator, END)
+                if item is END:
+                    break
+                put(item)
+        except Exception as e:
+            put(e)
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+            put(END)
+
+    await asyncio.to_thread(pump)
+
+class Speculation:
+    """Answer work started before the decision model has replied.
+
+    ``make_answer`` must return an iterator of answer chunks that writes
+    nothing to the chat log; the caller saves the exchange only after
+    claiming the answer. Anything not claimed is stopped and thrown away by
+    ``Discard``.
+    """
+
+    def __init__(self, prompt, make_answer, make_search=None, metadata=None):
+        self.prompt = prompt
+        self.metadata = metadata if metadata is not None else {}  # Filled in by the answer stream.
+        self.key = NormalizeQuery(prompt)
+        self.claimed = False
+        self._stop = threading.Event()
+        self._chunks = asyncio.Queue(maxsize=CHUNK_QUEUE_SIZE)
+        self._answer = asyncio.create_task(PumpIterator(make_answer, self._chunks, self._stop))
+        self._search = asyncio.create_task(asyncio.to_thread(make_search)) if make_search else None
+
+    def Matches(self, query):
+        """True when ``query`` asks the same thing the speculation was started for."""
+        return NormalizeQuery(query) == self.key
+
+    def ClaimAnswer(self):
+        """Take over the speculative answer: returns its chunk queue and pump task."""
+        self.claimed = True
+        return self._chunks, self._answer
+
+    async def ClaimSearch(self):
+        """Return the prefetched search results, or None if there are none."""
+        if self._search is None:
+            return None
+        try:
+            return await self._search
+        except Exception as e:
+            print(f"Speculative search failed: {e}")
+            return None
+
+    async def Discard(self):
+        """Stop an unclaimed answer stream and drop whatever it produced."""
+        if self.claimed:
+            return
+        self._stop.set()
+        while await self._chunks.get() is not END:
+            pass
+        await self._answer
+
+class AnswerPart:
+    """One task of a decision that adds text to the answer.
+
+    ``kind`` is "general", "realtime" or "exit" for parts answered by a model
+    stream, or "notice" for a fixed message such as a background job being
+    started. Chunks arrive on an unbounded queue, so a part that finishes
+    before the parts ahead of it is buffered instead of holding up its stream.
+    """
+
+    def __init__(self, kind, query, text=None):
+        self.kind = kind
+        self.query = query
+        self.prompt = query  # The text sent to the model, logged with the answer.
+        self.chunks = asyncio.Queue()
+        self.answer = ""
+        self.error = None
+        self.interrupted = False
+        self.metadata = {"route": kind}  # Model, latency and tokens, logged with the answer.
+        if text is not None:
+            self.chunks.put_nowait(text)
+            self.chunks.put_nowait(END)
+
+class SpeechPlanner:
+    """Decides which parts of a streaming answer get spoken, as they arrive.
+
+    Mirrors ``TextToSpeech``: the first two sentences are always spoken, so
+    they are released as soon as they are complete. When the answer ends, the
+    rest is spoken if the answer is short, or replaced by a pointer to the
+    chat screen if it has more than four sentences and 250 characters.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.released = 0  # Characters of ``text`` already handed to the speak stage.
+        self.sentences_released = 0
+
+    def feed(self, chunk):
+        """Add a chunk of the answer and return the sentences now ready to speak."""
+        self.text += chunk
+        ready = []
+        while self.sentences_released < 2:
+            end = self.text.find(".", self.released)
+            if end < 0:
+                break
+            sentence = self.text[self.released:end + 1].strip()
+            self.released = end + 1
+            self.sentences_released += 1
+            if sentence:
+                ready.append(sentence)
+        return ready
+
+    def finish(self):
+        """Return what is left to speak once the answer is complete."""
+        if len(self.text.split(".")) > 4 and len(self.text) > 250:
+            return random.choice(LongAnswerResponses)
+        return self.text[self.released:].strip()
+
+class Speaker:
+    """The speak stage shared by all queries.
+
+    Each query gets its own bounded queue of utterances. Queries take turns
+    in the order they started, so one answer is never spoken over another,
+    but a query only waits for the speaker in its own speak task. The
+    pipeline itself finishes once the answer is rendered, and the next query
+    can start while this one is still being read out. Cancelling a query's
+    token stops its playback and drops the rest of its utterances.
+    """
+
+    def __init__(self, speak):
+        self.speak = speak  # Blocking callable taking the text, a keep-playing callback and a deadline.
+        self._turn = None
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def Start(self, ctx):
+        """Create the speak task for ``ctx`` and return the queue that feeds it."""
+        if self._turn is None:
+            self._turn = asyncio.Lock()
+        with self._pending_lock:
+            self._pending += 1
+            self._idle.clear()
+        utterances = asyncio.Queue(maxsize=SPEECH_QUEUE_SIZE)
+        ctx.speech_task = asyncio.create_task(self._run(ctx, utterances))
+        return utterances
+
+    async def _run(self, ctx, utterances):
+        try:
+            async with self._turn:
+                while True:
+                    text = await utterances.get()
+                    if text is END:
+                        break
+                    if not text or ctx.cancel.cancelled:
+                        continue
+                    # Only the first utterance is on the clock; later ones follow it without delay
+                    deadline = None if "first_audio" in ctx.timings else ctx.deadline
+                    ctx.mark("first_audio")
+                    with ctx.stage("speak"):
+                        await asyncio.to_thread(self.speak, text, ctx.cancel.Alive, deadline)
+        except Exception as e:
+            print(f"Error in speak stage: {e}")
+            traceback.print_exc()
+        finally:
+            with self._pending_lock:
+                self._pending -= 1
+                if not self._pending:
+                    self._idle.set()
+
+    def WaitUntilIdle(self, timeout=None):
+        """Block the calling thread until nothing is queued or being spoken."""
+        return self._idle.wait(timeout)
@@ -0,0 +1,8 @@
+import string  # Import string for the punctuation stripped when comparing queries.
+
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+# Function to reduce a query to the words that matter when comparing two queries.
+def NormalizeQuery(query):
+    """Case-fold, strip punctuation and collapse whitespace."""
+    return " ".join(query.casefold().translate(_PUNCTUATION).split())
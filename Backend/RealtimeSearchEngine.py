@@ -1,8 +1,19 @@
 from googlesearch import search
 from groq import Groq  # Importing the Groq library to use its API.
-from json import load, dump  # Importing functions to read and write JSON files.
 import datetime  # Importing the datetime module for real-time date and time information.
 from dotenv import dotenv_values  # Importing dotenv_values to read environment variables from a .env file.
+import os  # Importing os for file path handling.
+import sys  # Importing sys to extend the import path when run as a script.
+from time import perf_counter  # Importing perf_counter to time the answers.
+
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.Cancellation import CancellableStream, MarkInterrupted
+from Backend.Conversation import GetConversation
+from Backend.ContextWindow import GetContextWindow, ContextTokens, CountTokens
+from Backend.ConversationStore import TokenUsage
+from Backend.Deadline import TimeLeft, MIN_STREAM_TIMEOUT
 
 # Load environment variables from the .env file.
 env_vars = dotenv_values(".env")
@@ -18,24 +29,17 @@ except KeyError as e:
 # Initialize the Groq client with the provided API key.
 client = Groq(api_key=GroqAPIKey)
 
+# Model used for search-grounded answers.
+SearchModel = "llama3-70b-8192"
+
 # Define the system instructions for the chatbot.
 System = f"""Hello, I am {Username}, You are a very accurate and advanced AI chatbot named {Assistantname} which has real-time up-to-date information from the internet.
 *** Provide Answers In a Professional Way, make sure to add full stops, commas, question marks, and use proper grammar.***
 *** Just answer the question from the provided data in a professional way. ***"""
 
-# Try to load the chat log from a JSON file, or create an empty one if it doesn’t exist.
-chatlog_path = "Data/ChatLog.json"
-try:
-    with open(chatlog_path, "r") as f:
-        messages = load(f)
-except (FileNotFoundError, ValueError):
-    messages = []
-    with open(chatlog_path, "w") as f:
-        dump(messages, f)
-
 # Function to perform a Google search and format the results.
-def GoogleSearch(query):
-    results = list(search(query, advanced=True, num_results=5))
+def GoogleSearch(query, deadline=None):
+    results = list(search(query, advanced=True, num_results=5, timeout=TimeLeft(deadline, 5)))
     Answer = f"The search results for '{query}' are:\n[start]\n"
 
     for i in results:
@@ -44,6 +48,11 @@ def GoogleSearch(query):
     Answer += "[end]"
     return Answer
 
+# Function to stand in for search results that could not be fetched in time.
+def NoSearchResults(query):
+    return (f"No search results are available for '{query}'. Answer from what you already know "
+            "and mention that the information may not be up to date.")
+
 # Function to clean up the answer by removing empty lines.
 def AnswerModifier(Answer):
     return "\n".join([line for line in Answer.split("\n") if line.strip()])
@@ -60,44 +69,70 @@ def Information():
     current_date_time = datetime.datetime.now()
     return f"Real-time Information:\nDay: {current_date_time.strftime('%A')}\nDate: {current_date_time.strftime('%d')}\nMonth: {current_date_time.strftime('%B')}\nYear: {current_date_time.strftime('%Y')}\nTime: {current_date_time.strftime('%H')} hours, {current_date_time.strftime('%M')} minutes, {current_date_time.strftime('%S')} seconds.\n"
 
-# Function to handle real-time search and response generation.
-def RealtimeSearchEngine(prompt):
-    # Load the chat log from the JSON file.
-    try:
-        with open(chatlog_path, "r") as f:
-            messages = load(f)
-    except (FileNotFoundError, ValueError):
-        messages = []
-
+# Function to stream a search-grounded answer as the model produces it.
+def RealtimeSearchEngineStream(prompt, SearchResults=None, cancel=None, deadline=None, save=True, metadata=None):
+    """Yield the answer in chunks; pass ``SearchResults`` when the search already ran.
+
+    A fired ``cancel`` token closes the model stream and the partial answer
+    is logged as interrupted. The search and the model request share the
+    ``deadline``; a search that fails or runs out of time is answered without
+    results. With ``save`` False nothing is logged; the caller logs the
+    exchange with Chatbot.AppendChatExchange. ``metadata``, if given, is a
+    dict that receives the model, latency and token counts for the chat log.
+    """
+    metadata = {} if metadata is None else metadata
+    metadata.update(route="realtime", model=SearchModel)
+    started = perf_counter()
+
+    # Add Google search results for this query only.
+    if SearchResults is None:
+        try:
+            SearchResults = GoogleSearch(prompt, deadline)
+        except Exception as e:
+            print(f"Search failed, answering without results: {e}")
+            SearchResults = NoSearchResults(prompt)
+    SearchContext = [{"role": "system", "content": SearchResults}]
+
+    # Load as much chat history as the search results leave room for.
+    messages = GetContextWindow().Messages(max(ContextTokens // 4, ContextTokens - CountTokens(SearchResults)), query=prompt)
     messages.append({"role": "user", "content": prompt})
 
-    # Add Google search results to the system chatbot messages.
-    SystemChatBot.append({"role": "system", "content": GoogleSearch(prompt)})
-
     # Generate a response using the Groq client.
     completion = client.chat.completions.create(
-        model="llama3-70b-8192",
-        messages=SystemChatBot + [{"role": "system", "content": Information()}] + messages,
+        model=SearchModel,
+        messages=SystemChatBot + SearchContext + [{"role": "system", "content": Information()}] + messages,
         temperature=0.7,
         max_tokens=2048,
         top_p=1,
         stream=True,
-        stop=None
+        stop=None,
+        timeout=TimeLeft(deadline, 60, minimum=MIN_STREAM_TIMEOUT)  # 60 s is the client default when there is no deadline
     )
 
     Answer = ""
-    for chunk in completion:
-        if chunk.choices and chunk.choices[0].delta.content:
-            Answer += chunk.choices[0].delta.content
+    interrupted = False
+    try:
+        for chunk in CancellableStream(completion, cancel):
+            metadata.update(TokenUsage(chunk))
+            if chunk.choices and chunk.choices[0].delta.content:
+                Answer += chunk.choices[0].delta.content
+                yield chunk.choices[0].delta.content
+    except GeneratorExit:
+        interrupted = True  # The consumer stopped reading.
 
     Answer = AnswerModifier(Answer)
+    interrupted = interrupted or (cancel is not None and cancel.cancelled)
+    if interrupted:
+        Answer = MarkInterrupted(Answer)
+    metadata["latency"] = perf_counter() - started
 
-    # Append the answer to the chat log and save it.
-    messages.append({"role": "assistant", "content": Answer})
-    with open(chatlog_path, "w") as f:
-        dump(messages, f)
+    # Append the question and the answer to the chat log.
+    if save:
+        GetConversation().AddExchange(prompt, Answer, interrupted=interrupted, **metadata)
 
-    return Answer
+# Function to handle real-time search and response generation.
+def RealtimeSearchEngine(prompt):
+    return AnswerModifier("".join(RealtimeSearchEngineStream(prompt)))
 
 # If this file is run directly, start the interactive chatbot loop.
 if __name__ == "__main__":
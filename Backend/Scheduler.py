@@ -0,0 +1,146 @@
+import asyncio  # Import asyncio to await jobs from the pipeline.
+import concurrent.futures  # Import concurrent.futures for the job result type.
+import heapq  # Import heapq for the priority queue.
+import itertools  # Import itertools for first-in first-out order within a class.
+import threading  # Import threading for the worker threads.
+import traceback  # Import traceback for detailed error information.
+from time import perf_counter  # Import perf_counter to time the jobs.
+
+# Priority classes, most urgent first.
+INTERACTIVE = 0  # Work a user is waiting on: decisions, searches, system commands.
+BACKGROUND = 1  # Long jobs that report back when done: image generation, content writing.
+
+CLASS_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+class Job:
+    """One unit of blocking work and the future it resolves."""
+
+    def __init__(self, func, args, kwargs, priority, name, on_done):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.name = name or getattr(func, "__name__", "job")
+        self.on_done = on_done
+        self.future = concurrent.futures.Future()
+        self.submitted = perf_counter()
+        self.started = None
+        self.finished = None
+
+    def __repr__(self):
+        return f"<Job {self.name} ({CLASS_NAMES.get(self.priority, self.priority)})>"
+
+class Scheduler:
+    """Runs blocking work on worker threads, interactive work first.
+
+    Workers take the most urgent job queued. ``reserved`` of them only ever
+    take interactive jobs, so however many background jobs are running or
+    queued, an interactive job starts at once. Background jobs are not
+    interrupted once started; they report their result through ``on_done``,
+    which is called on the worker thread with the finished Job.
+    """
+
+    def __init__(self, workers=4, reserved=2, name="Scheduler"):
+        if not 0 < reserved < workers:
+            raise ValueError("reserved must leave at least one worker for background jobs")
+        self._queue = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._running = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._stopped = False
+        self._threads = []
+        for i in range(workers):
+            interactive_only = i < reserved
+            thread = threading.Thread(
+                target=self._work, args=(interactive_only,), name=f"{name}-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def Submit(self, func, *args, priority=INTERACTIVE, name=None, on_done=None, **kwargs):
+        """Queue ``func(*args, **kwargs)`` and return a concurrent.futures.Future for its result."""
+        if priority not in CLASS_NAMES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        job = Job(func, args, kwargs, priority, name, on_done)
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("Scheduler has been shut down")
+            heapq.heappush(self._queue, (priority, next(self._order), job))
+            self._condition.notify_all()
+        return job.future
+
+    async def Run(self, func, *args, priority=INTERACTIVE, name=None, **kwargs):
+        """Await ``func(*args, **kwargs)`` run on a worker, like ``asyncio.to_thread``."""
+        return await asyncio.wrap_future(self.Submit(func, *args, priority=priority, name=name, **kwargs))
+
+    def Pending(self, priority=None):
+        """Number of jobs queued or running, in one class or in all of them."""
+        with self._condition:
+            queued = [job for _, _, job in self._queue if priority is None or job.priority == priority]
+            running = sum(n for p, n in self._running.items() if priority is None or p == priority)
+            return len(queued) + running
+
+    def Shutdown(self, wait=False):
+        """Stop taking jobs; queued jobs are cancelled."""
+        with self._condition:
+            self._stopped = True
+            for _, _, job in self._queue:
+                job.future.cancel()
+            self._queue.clear()
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _next_job(self, interactive_only):
+        with self._condition:
+            while True:
+                if self._stopped:
+                    return None
+                if self._queue and (not interactive_only or self._queue[0][0] == INTERACTIVE):
+                    job = heapq.heappop(self._queue)[2]
+                    self._running[job.priority] += 1
+                    return job
+                self._condition.wait()
+
+    def _work(self, interactive_only):
+        while True:
+            job = self._next_job(interactive_only)
+            if job is None:
+                return
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    job.started = perf_counter()
+                    try:
+                        job.future.set_result(job.func(*job.args, **job.kwargs))
+                    except BaseException as e:
+                        job.future.set_exception(e)
+                    job.finished = perf_counter()
+                    if job.on_done is not None:
+                        try:
+                            job.on_done(job)
+                        except Exception as e:
+                            print(f"Error reporting {job!r}: {e}")
+                            traceback.print_exc()
+            finally:
+                with self._condition:
+                    self._running[job.priority] -= 1
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+# Function to get the process-wide scheduler, starting it on first use.
+def GetScheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
+
+# Function to queue a background job that reports back when it is done.
+def SubmitBackground(func, *args, name=None, on_done=None, **kwargs):
+    return GetScheduler().Submit(func, *args, priority=BACKGROUND, name=name, on_done=on_done, **kwargs)
+
+# Function to await blocking interactive work from the pipeline.
+async def RunInteractive(func, *args, name=None, **kwargs):
+    return await GetScheduler().Run(func, *args, priority=INTERACTIVE, name=name, **kwargs)
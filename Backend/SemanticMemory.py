@@ -0,0 +1,342 @@
+import argparse  # Import argparse for the eval command line.
+import math  # Import math for the term weights.
+import os  # Import os for file path handling.
+import random  # Import random to sample held-out pairs.
+import re  # Import re to tokenize turns.
+import sys  # Import sys to extend the import path when run as a script.
+import threading  # Import threading to index turns once at a time.
+import traceback  # Import traceback for detailed error information.
+import zlib  # Import zlib for a hash that is stable across runs.
+from collections import Counter  # Import Counter for term frequencies.
+
+import numpy as np  # Import NumPy for the index arrays and the scoring.
+
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.Conversation import GetConversation
+from Backend.EventBus import Subscribe, CHAT_TURN
+from Backend.Scheduler import SubmitBackground
+
+TermsPath = os.path.join("Data", "Memory.terms")
+RowsPath = os.path.join("Data", "Memory.rows")
+# The dense vector index this replaces; removed when found.
+OldPaths = [os.path.join("Data", "Memory.vectors"), os.path.join("Data", "Memory.index")]
+
+# Cosine similarity a past turn needs to be recalled. Set on held-out pairs so
+# that fewer than 1 in 1000 unrelated exchanges pass; check it against your own
+# history with ``python -m Backend.SemanticMemory eval``.
+MIN_SCORE = 0.25
+ANSWER_WEIGHT = 0.5  # Weight of the answer's words relative to the question's.
+ANSWER_TERMS = 24  # Most frequent answer words indexed per exchange, so long answers don't dominate.
+INLINE_BACKLOG = 16  # Unindexed messages indexed on the spot; more go to a background job.
+SEAL_ROWS = 1024  # Exchanges kept in the small in-memory tail before the index is rebuilt.
+
+TERM = np.dtype([("term", "<u4"), ("weight", "<f4")])  # One record of Memory.terms
+ROW = np.dtype([("start", "<i8"), ("terms", "<i8")])  # One record of Memory.rows
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Words too common to say what a turn is about.
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "if", "of", "to", "in", "on", "at", "for", "with", "by", "from",
+    "is", "are", "was", "were", "be", "been", "am", "do", "does", "did", "have", "has", "had", "it", "its",
+    "this", "that", "these", "those", "i", "you", "he", "she", "we", "they", "me", "my", "your", "his", "her",
+    "our", "their", "what", "who", "how", "why", "when", "where", "which", "can", "could", "would", "will",
+    "should", "about", "tell", "please", "so", "as", "not", "no", "yes", "just", "also", "there", "here",
+    "s", "t", "m", "d", "ll", "re", "ve",
+}
+
+def _words(text):
+    return [word for word in _TOKEN.findall(text.lower()) if word not in STOPWORDS]
+
+def _term(gram):
+    return zlib.crc32(gram.encode("utf-8"))
+
+# Function to weigh the terms of an exchange.
+def TermWeights(query, answer=""):
+    """``{term id: weight}`` for an exchange or a question.
+
+    Terms are the question's words and word pairs plus the ANSWER_TERMS most
+    frequent words of the answer at ANSWER_WEIGHT, with log-scaled counts.
+    A term id is the word's 32-bit CRC, so unrelated words practically never
+    share one.
+    """
+    weights = {}
+    words = _words(query)
+    for gram, count in Counter(words + [f"{a} {b}" for a, b in zip(words, words[1:])]).items():
+        term = _term(gram)
+        weights[term] = weights.get(term, 0.0) + 1 + math.log(count)
+    if answer:
+        for word, count in Counter(_words(answer)).most_common(ANSWER_TERMS):
+            term = _term(word)
+            weights[term] = weights.get(term, 0.0) + ANSWER_WEIGHT * (1 + math.log(count))
+    return weights
+
+def _idf(rows, frequency):
+    return math.log((rows + 1) / (frequency + 1)) + 1
+
+class SemanticMemory:
+    """Finds the past turns most related to a question.
+
+    Every exchange (a question with its answer) is one row of a sparse
+    inverted index scored by TF-IDF cosine similarity. ``Memory.terms``
+    holds the raw term weights of every row, appended one exchange at a
+    time; ``Memory.rows`` holds, for each row, the position of the
+    exchange's first message in the conversation and its number of terms.
+    New exchanges arrive over the event bus. History not indexed yet, like
+    the whole log on the first run, is indexed in a background job.
+
+    The index is built from the terms file in a background job at start: the
+    rows of each term sorted together, with weights normalized under the
+    document frequencies of that moment. Exchanges added later go to a small
+    tail and are folded in by a rebuild every SEAL_ROWS exchanges. A search
+    only reads the rows of the question's terms, and the index takes about
+    8 bytes per term of each exchange.
+    """
+
+    def __init__(self, conversation, terms_path=TermsPath, rows_path=RowsPath):
+        self.conversation = conversation
+        self.terms_path = terms_path
+        self.rows_path = rows_path
+        self._lock = threading.Lock()  # Guards the files and the index.
+        self._catching_up = False
+        rows = np.fromfile(rows_path, dtype=ROW) if os.path.exists(rows_path) else np.zeros(0, ROW)
+        size = os.path.getsize(terms_path) if os.path.exists(terms_path) else 0
+        self._starts, self._counts = rows["start"].copy(), rows["terms"].copy()
+        if size != int(self._counts.sum()) * TERM.itemsize:
+            print("Semantic memory files don't match, indexing the history again")
+            self._reset()
+        self._clear_index()
+        self.upto = self._indexed_upto()  # Messages of the conversation already indexed.
+        if self.upto > conversation.Count():  # The history was rewritten
+            self._reset()
+            self.upto = 0
+
+    def _reset(self):
+        for path in (self.terms_path, self.rows_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._starts, self._counts = np.zeros(0, np.int64), np.zeros(0, np.int64)
+
+    def _clear_index(self):
+        self._ids = np.zeros(0, np.uint32)  # Sorted term ids of the built index
+        self._offsets = np.zeros(1, np.int64)  # Where each term's rows start in _postings
+        self._postings = np.zeros(0, np.int32)
+        self._weights = np.zeros(0, np.float32)
+        self._sealed = 0  # Rows in the built index
+        self._tail = {}  # Term id -> ([rows], [weights]) for rows added since
+        self._tailed = 0  # Rows in the tail, right after the sealed ones
+
+    def _indexed_upto(self):
+        if not len(self._starts):
+            return 0
+        start = int(self._starts[-1])
+        messages = self.conversation.Range(start, start + 2)
+        return start + len(self._span(messages))
+
+    @staticmethod
+    def _span(messages):
+        """The messages of the exchange starting ``messages``: a question and its answer, or one message."""
+        if len(messages) >= 2 and messages[0]["role"] == "user" and messages[1]["role"] == "assistant":
+            return messages[:2]
+        return messages[:1]
+
+    def _frequency(self, term):
+        i = int(np.searchsorted(self._ids, term))
+        sealed = int(self._offsets[i + 1] - self._offsets[i]) if i < len(self._ids) and self._ids[i] == term else 0
+        return sealed + len(self._tail.get(term, ((), ()))[0])
+
+    def _postings_of(self, term):
+        i = int(np.searchsorted(self._ids, term))
+        if i < len(self._ids) and self._ids[i] == term:
+            rows = self._postings[self._offsets[i]:self._offsets[i + 1]]
+            weights = self._weights[self._offsets[i]:self._offsets[i + 1]]
+        else:
+            rows, weights = self._postings[:0], self._weights[:0]
+        tail = self._tail.get(term)
+        if tail:
+            rows = np.concatenate([rows, np.asarray(tail[0], dtype=np.int32)])
+            weights = np.concatenate([weights, np.asarray(tail[1], dtype=np.float32)])
+        return rows, weights
+
+    def _seal(self):
+        """Rebuild the index from the terms file, with weights normalized under the current document frequencies."""
+        rows = len(self._starts)
+        self._clear_index()
+        if rows == 0:
+            return
+        terms = np.fromfile(self.terms_path, dtype=TERM)
+        row_of = np.repeat(np.arange(rows, dtype=np.int32), self._counts)
+        ids, inverse, frequency = np.unique(terms["term"], return_inverse=True, return_counts=True)
+        idf = np.log((rows + 1) / (frequency + 1)) + 1
+        norms = np.sqrt(np.bincount(row_of, weights=(terms["weight"] * idf[inverse]) ** 2, minlength=rows))
+        norms[norms == 0] = 1
+        order = np.argsort(inverse, kind="stable")
+        self._ids = ids.astype(np.uint32)
+        self._offsets = np.concatenate([[0], np.cumsum(frequency)])
+        self._postings = row_of[order]
+        self._weights = (terms["weight"] / norms[row_of])[order].astype(np.float32)
+        self._sealed = rows
+
+    def _append(self, exchanges, starts):
+        terms = np.array([item for weights in exchanges for item in weights.items()], dtype=TERM)
+        with open(self.terms_path, "ab") as file:
+            file.write(terms.tobytes())
+        rows = np.zeros(len(exchanges), dtype=ROW)
+        rows["start"], rows["terms"] = starts, [len(weights) for weights in exchanges]
+        with open(self.rows_path, "ab") as file:
+            file.write(rows.tobytes())
+        count = len(self._starts)
+        self._starts = np.concatenate([self._starts, rows["start"]])
+        self._counts = np.concatenate([self._counts, rows["terms"]])
+        if self._sealed + self._tailed != count or len(self._starts) - self._sealed > SEAL_ROWS:
+            return  # Left to the rebuild at the end of CatchUp
+        for row, weights in enumerate(exchanges, count):
+            norm = math.sqrt(sum((weight * _idf(row + 1, self._frequency(term) + 1)) ** 2
+                                 for term, weight in weights.items())) or 1
+            for term, weight in weights.items():
+                postings = self._tail.setdefault(term, ([], []))
+                postings[0].append(row)
+                postings[1].append(weight / norm)
+        self._tailed += len(exchanges)
+
+    def CatchUp(self, batch=512):
+        """Index every message added since the last call."""
+        with self._lock:
+            while True:
+                total = self.conversation.Count()
+                messages = self.conversation.Range(self.upto, min(total, self.upto + batch))
+                exchanges, starts, position = [], [], 0
+                while position < len(messages):
+                    span = self._span(messages[position:])
+                    if span[0]["role"] == "user" and len(span) == 1 and self.upto + position + 1 >= total:
+                        break  # A question whose answer isn't logged yet
+                    exchanges.append(TermWeights(*(message["content"] for message in span)))
+                    starts.append(self.upto + position)
+                    position += len(span)
+                if exchanges:
+                    self._append(exchanges, starts)
+                self.upto += position
+                if position == 0 or self.upto >= total:
+                    break
+            if self._sealed + self._tailed < len(self._starts):
+                self._seal()
+
+    def _catch_up_in_background(self):
+        try:
+            self.CatchUp()
+        except Exception as e:
+            print(f"Error indexing the conversation: {e}")
+            traceback.print_exc()
+        finally:
+            self._catching_up = False
+
+    def OnTurn(self, turn):
+        """Event bus callback for a logged exchange."""
+        backlog = self.conversation.Count() - self.upto
+        if backlog <= INLINE_BACKLOG and len(self._starts) - self._sealed < SEAL_ROWS:
+            self.CatchUp()
+        elif not self._catching_up:
+            self._catching_up = True
+            SubmitBackground(self._catch_up_in_background, name="indexing the conversation")
+
+    def Scores(self, query, before=None):
+        """Cosine similarity of ``query`` to every exchange starting before message ``before``, and their starts."""
+        weights = TermWeights(query)
+        with self._lock:
+            rows = len(self._starts) if before is None else int(np.searchsorted(self._starts, before))
+            scores = np.zeros(rows, dtype=np.float32)
+            if rows == 0 or not weights:
+                return scores, self._starts[:rows]
+            norm = 0.0
+            for term, weight in weights.items():
+                postings, values = self._postings_of(term)
+                idf = _idf(len(self._starts), len(postings))
+                norm += (weight * idf) ** 2
+                keep = postings < rows
+                scores[postings[keep]] += weight * idf * idf * values[keep]
+            starts = self._starts[:rows]
+        return scores / math.sqrt(norm), starts
+
+    def Search(self, query, k=4, before=None):
+        """``[(score, start)]`` for the ``k`` exchanges most like ``query``, best first.
+
+        Only exchanges that start before message ``before`` are considered,
+        e.g. those older than the recent window.
+        """
+        scores, starts = self.Scores(query, before)
+        found = np.flatnonzero(scores >= MIN_SCORE)
+        top = found[np.argsort(scores[found])[::-1][:k]]
+        return [(float(scores[i]), int(starts[i])) for i in top]
+
+    def Recall(self, query, k=4, before=None):
+        """The messages of the exchanges Search finds, oldest first."""
+        found = sorted(start for _, start in self.Search(query, k, before))
+        return [self._span(self.conversation.Range(start, start + 2)) for start in found]
+
+_memory = None
+_memory_lock = threading.Lock()
+
+# Function to get the process-wide semantic memory, building the index in the background.
+def GetMemory():
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            for path in OldPaths:
+                if os.path.exists(path):
+                    os.remove(path)
+            _memory = SemanticMemory(GetConversation())
+            Subscribe(CHAT_TURN, _memory.OnTurn)
+            _memory._catching_up = True
+            SubmitBackground(_memory._catch_up_in_background, name="indexing the conversation")
+        return _memory
+
+# Function to check the recall threshold on held-out pairs from the history.
+def Evaluate(memory, pairs=500, seed=0):
+    """Score sampled questions against their own exchange and against unrelated ones.
+
+    The related query is the question with every other word left out, a
+    stand-in for asking about the same thing in other words; unrelated
+    exchanges are at least 100 messages away. Prints, for a range of
+    thresholds, the share of each that would be recalled.
+    """
+    rng = random.Random(seed)
+    rows = [row for row, start in enumerate(memory._starts)
+            if memory.conversation.Range(int(start), int(start) + 1)[0]["role"] == "user"]
+    related, unrelated = [], []
+    for row in rng.sample(rows, min(pairs, len(rows))):
+        start = int(memory._starts[row])
+        words = memory.conversation.Range(start, start + 1)[0]["content"].split()
+        scores, starts = memory.Scores(" ".join(words[::2]))
+        related.append(float(scores[row]))
+        far = np.flatnonzero(np.abs(starts - start) >= 100)
+        if len(far):
+            unrelated.append(float(scores[rng.choice(far.tolist())]))
+    if not related:
+        print("No questions in the history to evaluate")
+        return
+    print(f"{len(related)} related and {len(unrelated)} unrelated pairs")
+    print("threshold  related recalled  unrelated recalled")
+    for threshold in (0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.5):
+        hits = sum(score >= threshold for score in related) / len(related)
+        misses = sum(score >= threshold for score in unrelated) / max(1, len(unrelated))
+        marker = "  <- MIN_SCORE" if threshold == MIN_SCORE else ""
+        print(f"{threshold:9.2f}  {hits:16.1%}  {misses:18.1%}{marker}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the semantic memory's recall threshold.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    evaluate = commands.add_parser("eval", help="score held-out pairs from the chat history")
+    evaluate.add_argument("--pairs", type=int, default=500)
+    evaluate.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "eval":
+        memory = SemanticMemory(GetConversation())
+        memory.CatchUp()
+        Evaluate(memory, args.pairs, args.seed)
+        GetConversation().Close()
+
+if __name__ == "__main__":
+    main()
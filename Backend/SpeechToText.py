@@ -6,12 +6,18 @@ from webdriver_manager.chrome import ChromeDriverManager
 from dotenv import dotenv_values
 
 import os
+import sys
 import mtranslate as mt
 import time
 import speech_recognition as sr
 import traceback
 import random
 
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend import EventBus, StatusBoard
+
 # Load environment variables from the .env file.
 try:
     env_vars = dotenv_values(".env")
@@ -30,11 +36,11 @@ os.makedirs(TempDirPath, exist_ok=True)
 recognizer = None
 microphone = None
 
-# Function to set the assistant's status by writing it to a file.
+# Function to set the assistant's status on the shared status board and the event bus.
 def SetAssistantStatus(Status):
     try:
-        with open(f"{TempDirPath}/Status.data", "w", encoding="utf-8") as file:
-            file.write(Status)
+        StatusBoard.WriteBoard(StatusBoard.STATUS, Status)
+        EventBus.Publish(EventBus.STATUS, Status)
     except Exception as e:
         print(f"Error setting assistant status: {e}")
 
@@ -0,0 +1,134 @@
+import mmap  # Import mmap to share the board between processes without file reads.
+import os  # Import os for file handling.
+import struct  # Import struct to lay out the fixed-size fields.
+import threading  # Import threading to serialise writers within a process.
+
+# Fields on the board and the number of bytes of UTF-8 text each can hold.
+MIC = "mic"  # "True" while the microphone is listening, "False" otherwise.
+STATUS = "status"  # The assistant status line.
+IMAGE_GENERATION = "image_generation"  # "<prompt>,<state>" for Backend/Imagegeneration.py.
+
+FIELDS = (
+    (MIC, 16),
+    (STATUS, 256),
+    (IMAGE_GENERATION, 1024),
+)
+
+MAGIC = b"JSB1"
+_HEADER = struct.Struct("<4s4x")  # magic, padding
+_SLOT = struct.Struct("<QI4x")  # sequence, length, padding
+_SEQ = struct.Struct("<Q")
+
+BoardPath = os.path.join(os.getcwd(), "Frontend", "Files", "Status.board")
+
+class StatusBoard:
+    """Fixed-layout shared memory for small pieces of backend/GUI state.
+
+    Every field is a seqlock: a writer bumps the field's sequence number to an
+    odd value, writes the text, then bumps it to the next even value. Readers
+    retry while the sequence is odd or moved during the copy, so they never
+    see a half-written string. Checking whether a field changed is a single
+    8-byte read from the mapping, with no system calls.
+
+    Writers of one field are serialised within a process; across processes
+    each field is expected to have one writer at a time (the GUI owns the mic,
+    the backend owns the status, and the image job owns its field while it
+    runs).
+    """
+
+    def __init__(self, path=BoardPath):
+        self.path = path
+        self._offsets = {}
+        self._capacity = {}
+        offset = _HEADER.size
+        for name, capacity in FIELDS:
+            self._offsets[name] = offset
+            self._capacity[name] = capacity
+            offset += _SLOT.size + capacity
+        self.size = offset
+        self._locks = {name: threading.Lock() for name, _ in FIELDS}
+        self._map = self._open()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a+b") as file:
+            if os.fstat(file.fileno()).st_size != self.size:
+                # A new board, or one from a different layout: start from zero.
+                file.truncate(0)
+                file.truncate(self.size)
+            board = mmap.mmap(file.fileno(), self.size)
+        if board[:len(MAGIC)] != MAGIC:
+            _HEADER.pack_into(board, 0, MAGIC)
+        return board
+
+    def Sequence(self, field):
+        return _SEQ.unpack_from(self._map, self._offsets[field])[0]
+
+    def Changed(self, field, since):
+        return self.Sequence(field) != since
+
+    def Write(self, field, text, suffix=""):
+        """Store ``text + suffix``; a value too long for the field loses the end of ``text``, never ``suffix``.
+
+        Keeps e.g. the ",True" of an image field's "<prompt>,<state>" intact
+        when the prompt is longer than the field.
+        """
+        offset = self._offsets[field]
+        tail = suffix.encode("utf-8")[:self._capacity[field]]
+        data = text.encode("utf-8")[:self._capacity[field] - len(tail)]
+        # Don't leave half a multi-byte character at the cut.
+        data = data.decode("utf-8", errors="ignore").encode("utf-8") + tail
+
+        with self._locks[field]:
+            seq = self.Sequence(field)
+            if seq % 2:
+                seq += 1  # A writer died mid-update; move past its odd value.
+            _SEQ.pack_into(self._map, offset, seq + 1)
+            start = offset + _SLOT.size
+            self._map[start:start + len(data)] = data
+            _SLOT.pack_into(self._map, offset, seq + 1, len(data))
+            _SEQ.pack_into(self._map, offset, seq + 2)
+        return seq + 2
+
+    def Read(self, field):
+        """Return ``(text, sequence)``; ``sequence`` is 0 for a field never written."""
+        offset = self._offsets[field]
+        start = offset + _SLOT.size
+        for _ in range(100000):
+            seq, length = _SLOT.unpack_from(self._map, offset)
+            if seq % 2:
+                continue
+            data = self._map[start:start + min(length, self._capacity[field])]
+            if self.Sequence(field) == seq:
+                return data.decode("utf-8", errors="replace"), seq
+        # A writer died mid-update; its odd sequence never clears. Take what is
+        # there rather than spinning forever.
+        seq, length = _SLOT.unpack_from(self._map, offset)
+        data = self._map[start:start + min(length, self._capacity[field])]
+        return data.decode("utf-8", errors="replace"), seq
+
+_board = None
+_board_lock = threading.Lock()
+
+def GetStatusBoard():
+    global _board
+    if _board is None:
+        with _board_lock:
+            if _board is None:
+                _board = StatusBoard()
+    return _board
+
+# Convenience wrappers over the process-wide board.
+
+def WriteBoard(field, text, suffix=""):
+    return GetStatusBoard().Write(field, text, suffix)
+
+def ReadBoard(field, default=""):
+    text, seq = GetStatusBoard().Read(field)
+    return (text if seq else default), seq
+
+def BoardSequence(field):
+    return GetStatusBoard().Sequence(field)
+
+def BoardChanged(field, since):
+    return GetStatusBoard().Changed(field, since)
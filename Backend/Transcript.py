@@ -0,0 +1,85 @@
+from dotenv import dotenv_values  # Import dotenv_values to read the speaker names.
+import json  # Import json for the high-water mark.
+import os  # Import os for file sizes and atomic replacement.
+import sys  # Import sys to extend the import path when run as a script.
+
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.ConversationStore import GetStore
+
+env_vars = dotenv_values(".env")
+Username = env_vars.get("Username", "User")
+Assistantname = env_vars.get("Assistantname", "Jarvis")
+
+BATCH_SIZE = 1000  # Turns read from the store at a time when rebuilding.
+
+# Function to format one turn as transcript lines.
+def FormatTurn(role, content, user=Username, assistant=Assistantname):
+    """``Name : text`` with blank lines dropped; the name comes from the role, never from the text."""
+    name = user if role == "user" else assistant
+    lines = [line for line in content.split("\n") if line.strip()]
+    return f"{name} : " + "\n".join(lines) + "\n"
+
+def _read_mark(path):
+    try:
+        with open(path + ".mark", "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write_mark(path, mark):
+    temp_path = path + ".mark.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(mark, file)
+    os.replace(temp_path, path + ".mark")
+
+def _render(turns, user, assistant):
+    return "".join(FormatTurn(turn["role"], turn["content"], user, assistant) for turn in turns).encode("utf-8")
+
+# Function to bring the rendered chat transcript up to date.
+def UpdateTranscript(path, store=None, user=Username, assistant=Assistantname):
+    """Append the turns logged since the last update to the transcript at ``path``.
+
+    ``path.mark`` records the last rendered turn (its id and timestamp), the
+    speaker names and the file size. Each update only reads turns newer than
+    that, so it costs the same however long the history is. The transcript
+    is rebuilt when the mark doesn't match: the file was changed, the names
+    changed, or the history was rewritten. Returns the number of turns
+    appended.
+    """
+    store = store or GetStore()
+    mark = _read_mark(path)
+    valid = (mark is not None and os.path.exists(path) and os.path.getsize(path) == mark["size"]
+             and (mark["user"], mark["assistant"]) == (user, assistant))
+    if valid and mark["id"]:
+        last = store.Turns(after=mark["id"] - 1, limit=1)
+        valid = bool(last) and last[0]["id"] == mark["id"] and last[0]["created"] == mark["created"]
+
+    if valid:
+        turns = store.Turns(after=mark["id"])
+        if not turns:
+            return 0
+        data = _render(turns, user, assistant)
+        with open(path, "ab") as file:
+            file.write(data)
+        size = mark["size"] + len(data)
+        count = len(turns)
+    else:
+        # Rebuild in batches, so the whole history is never held in memory at once.
+        temp_path = path + ".tmp"
+        size, count, turns = 0, 0, []
+        with open(temp_path, "wb") as file:
+            batch = store.Turns(limit=BATCH_SIZE)
+            while batch:
+                turns = batch
+                data = _render(batch, user, assistant)
+                file.write(data)
+                size += len(data)
+                count += len(batch)
+                batch = store.Turns(after=batch[-1]["id"], limit=BATCH_SIZE)
+        os.replace(temp_path, path)
+    last = turns[-1] if turns else {"id": 0, "created": None}
+    _write_mark(path, {"id": last["id"], "created": last["created"], "size": size,
+                       "user": user, "assistant": assistant})
+    return count
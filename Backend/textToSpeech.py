@@ -1,11 +1,17 @@
 import pygame  # Import pygame library for handling audio playback
 import random  # Import random for generating random choices
-import asyncio  # Import asyncio for asynchronous operations
 import edge_tts  # Import edge_tts for text-to-speech functionality
 import os  # Import os for file path handling
+import sys  # Import sys to extend the import path when run as a script
 from dotenv import dotenv_values  # Import dotenv for reading environment variables from a .env file
 import traceback  # Import traceback for detailed error information
 
+# Allow "Backend." imports when this file is run as a script.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.EventLoop import RunSync  # Run coroutines on the shared backend event loop
+from Backend.Deadline import TimeLeft  # Bound speech synthesis by the query's budget
+
 # Load environment variables from a .env file with error handling
 try:
     env_vars = dotenv_values(".env")
@@ -58,14 +64,22 @@ async def TextToAudioFile(text) -> None:
             print(f"Failed to create fallback audio file: {inner_e}")
 
 # Function to manage Text-to-Speech (TTS) functionality
-def TTS(Text, func=lambda r=None: True):
+def TTS(Text, func=lambda r=None: True, deadline=None):
     max_attempts = 3
     current_attempt = 0
     
     while current_attempt < max_attempts:
+        # Give up on speech once the deadline has passed; the text is on screen
+        if deadline is not None and deadline.expired:
+            print("TTS skipped: out of time")
+            return False
         try:
-            # Convert text to an audio file asynchronously
-            asyncio.run(TextToAudioFile(Text))
+            # Convert text to an audio file on the shared backend event loop
+            RunSync(TextToAudioFile(Text), timeout=TimeLeft(deadline))
+
+            # Don't start playback if we were stopped while the audio was generated
+            if func() == False:
+                return False
 
             # Initialize pygame mixer for audio playback
             pygame.mixer.init()
@@ -90,8 +104,9 @@ def TTS(Text, func=lambda r=None: True):
             try:
                 # Call the provided function with False to signal the end of TTS
                 func(False)
-                pygame.mixer.music.stop()  # Stop the audio playback
-                pygame.mixer.quit()  # Quit the pygame mixer
+                if pygame.mixer.get_init():  # Not initialised if playback never started
+                    pygame.mixer.music.stop()  # Stop the audio playback
+                    pygame.mixer.quit()  # Quit the pygame mixer
 
             except Exception as e:  # Handle any exceptions during cleanup
                 print(f"Error in finally block: {e}")
@@ -100,8 +115,32 @@ def TTS(Text, func=lambda r=None: True):
     print("All TTS attempts failed")
     return False
 
+# Predefined responses for cases where the text is too long to read out in full
+LongAnswerResponses = [
+    "The rest of the result has been printed to the chat screen, kindly check it out sir.",
+    "The rest of the text is now on the chat screen, sir, please check it.",
+    "You can see the rest of the text on the chat screen, sir.",
+    "The remaining part of the text is now on the chat screen, sir.",
+    "Sir, you'll find more text on the chat screen for you to see.",
+    "The rest of the answer is now on the chat screen, sir.",
+    "Sir, please look at the chat screen, the rest of the answer is there.",
+    "You'll find the complete answer on the chat screen, sir.",
+    "The next part of the text is on the chat screen, sir.",
+    "Sir, please check the chat screen for more information.",
+    "There's more text on the chat screen for you, sir.",
+    "Sir, take a look at the chat screen for additional text.",
+    "You'll find more to read on the chat screen, sir.",
+    "Sir, check the chat screen for the rest of the text.",
+    "The chat screen has the rest of the text, sir.",
+    "There's more to see on the chat screen, sir, please look.",
+    "Sir, the chat screen holds the continuation of the text.",
+    "You'll find the complete answer on the chat screen, kindly check it out sir.",
+    "Please review the chat screen for the rest of the text, sir.",
+    "Sir, look at the chat screen for the complete answer."
+]
+
 # Function to manage Text-to-Speech with additional responses for long text
-def TextToSpeech(Text, func=lambda r=None: True):
+def TextToSpeech(Text, func=lambda r=None: True, deadline=None):
     if not Text:
         print("Warning: Empty text passed to TextToSpeech")
         return False
@@ -109,45 +148,21 @@ def TextToSpeech(Text, func=lambda r=None: True):
     try:
         Data = str(Text).split('.')  # Split the text by periods into a list of sentences
 
-        # List of predefined responses for cases where the text is too long
-        responses = [
-            "The rest of the result has been printed to the chat screen, kindly check it out sir.",
-            "The rest of the text is now on the chat screen, sir, please check it.",
-            "You can see the rest of the text on the chat screen, sir.",
-            "The remaining part of the text is now on the chat screen, sir.",
-            "Sir, you'll find more text on the chat screen for you to see.",
-            "The rest of the answer is now on the chat screen, sir.",
-            "Sir, please look at the chat screen, the rest of the answer is there.",
-            "You'll find the complete answer on the chat screen, sir.",
-            "The next part of the text is on the chat screen, sir.",
-            "Sir, please check the chat screen for more information.",
-            "There's more text on the chat screen for you, sir.",
-            "Sir, take a look at the chat screen for additional text.",
-            "You'll find more to read on the chat screen, sir.",
-            "Sir, check the chat screen for the rest of the text.",
-            "The chat screen has the rest of the text, sir.",
-            "There's more to see on the chat screen, sir, please look.",
-            "Sir, the chat screen holds the continuation of the text.",
-            "You'll find the complete answer on the chat screen, kindly check it out sir.",
-            "Please review the chat screen for the rest of the text, sir.",
-            "Sir, look at the chat screen for the complete answer."
-        ]
-
         # If the text is very long (more than 4 sentences and 250 characters), add a response message
         if len(Data) > 4 and len(Text) > 250:
             # Get first two sentences and add a notification about the rest
             first_two_sentences = ".".join(Text.split('.')[:2]) + "."
-            notification = random.choice(responses)
-            return TTS(first_two_sentences + " " + notification, func)
+            notification = random.choice(LongAnswerResponses)
+            return TTS(first_two_sentences + " " + notification, func, deadline)
         else:
             # Otherwise, just play the whole text
-            return TTS(Text, func)
+            return TTS(Text, func, deadline)
             
     except Exception as e:
         print(f"Error in TextToSpeech: {e}")
         traceback.print_exc()
         # Try a simple fallback
-        return TTS("I encountered an error while speaking. Please check the chat screen.", func)
+        return TTS("I encountered an error while speaking. Please check the chat screen.", func, deadline)
 
 # Main execution loop
 if __name__ == "__main__":
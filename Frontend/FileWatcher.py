@@ -0,0 +1,161 @@
+import ctypes  # Import ctypes to reach the inotify calls in libc.
+import ctypes.util  # Import ctypes.util to locate libc.
+import errno  # Import errno to recognise interrupted reads.
+import os  # Import os for file and descriptor handling.
+import select  # Import select to block on the inotify descriptor.
+import struct  # Import struct to decode inotify events.
+import sys  # Import sys to detect the platform.
+import threading  # Import threading to run the watcher in the background.
+import traceback  # Import traceback for detailed error information.
+
+# inotify constants from <sys/inotify.h>.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1  # Raises AttributeError on libcs without inotify.
+        libc.inotify_add_watch
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+class FileWatcher:
+    """Calls ``callback(names)`` when files in ``directory`` change.
+
+    Uses inotify on Linux and falls back to comparing ``os.stat`` results on a
+    timer elsewhere. Events arriving within ``coalesce`` seconds of each other
+    are delivered as one call with the set of changed file names, so a burst
+    of writes produces a single callback. ``callback`` runs on the watcher
+    thread.
+    """
+
+    def __init__(self, directory, filenames, callback, coalesce=0.005, poll_interval=0.1):
+        self.directory = directory
+        self.filenames = set(filenames)
+        self.callback = callback
+        self.coalesce = coalesce
+        self.poll_interval = poll_interval
+        self.backend = "inotify" if _load_libc() else "stat"
+        self._stop = threading.Event()
+        self._thread = None
+        self._wake_r = self._wake_w = None
+
+    def start(self):
+        target = self._run_inotify if self.backend == "inotify" else self._run_stat
+        self._thread = threading.Thread(target=target, name="FileWatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._wake_w is not None:
+            try:
+                os.write(self._wake_w, b"x")
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def _deliver(self, changed):
+        changed &= self.filenames
+        if not changed:
+            return
+        try:
+            self.callback(changed)
+        except Exception as e:
+            print(f"Error in file watcher callback: {e}")
+            traceback.print_exc()
+
+    # inotify backend
+
+    def _run_inotify(self):
+        libc = _load_libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            print(f"inotify_init1 failed ({os.strerror(ctypes.get_errno())}), falling back to stat polling")
+            self.backend = "stat"
+            return self._run_stat()
+
+        # Writers truncate and rewrite in place, so wait for the close rather
+        # than reacting to every partial write.
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(fd, os.fsencode(self.directory), mask) < 0:
+            print(f"inotify_add_watch failed ({os.strerror(ctypes.get_errno())}), falling back to stat polling")
+            os.close(fd)
+            self.backend = "stat"
+            return self._run_stat()
+
+        self._wake_r, self._wake_w = os.pipe()
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([fd, self._wake_r], [], [])
+                if self._wake_r in ready:
+                    break
+                changed = self._read_events(fd)
+
+                # Gather whatever else lands during the coalescing window.
+                while True:
+                    ready, _, _ = select.select([fd, self._wake_r], [], [], self.coalesce)
+                    if fd not in ready:
+                        break
+                    changed |= self._read_events(fd)
+
+                self._deliver(changed)
+        finally:
+            os.close(fd)
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._wake_r = self._wake_w = None
+
+    def _read_events(self, fd):
+        changed = set()
+        while True:
+            try:
+                data = os.read(fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            if not data:
+                return changed
+
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if name:
+                    changed.add(os.fsdecode(name))
+
+    # stat fallback
+
+    def _snapshot(self):
+        snapshot = {}
+        for name in self.filenames:
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+                snapshot[name] = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                snapshot[name] = None
+        return snapshot
+
+    def _run_stat(self):
+        previous = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            changed = {name for name in current if current[name] != previous.get(name)}
+            previous = current
+            if changed:
+                self._deliver(changed)
@@ -1,10 +1,20 @@
 from PyQt5.QtWidgets import QApplication, QMainWindow, QTextEdit, QStackedWidget, QWidget, QLineEdit, QGridLayout, QVBoxLayout, QHBoxLayout, QPushButton, QFrame, QLabel, QSizePolicy, QAbstractScrollArea, QScrollArea, QGraphicsDropShadowEffect, QSpacerItem
 from PyQt5.QtGui import QIcon, QPainter, QColor, QTextCharFormat, QFont, QPixmap, QTextBlockFormat, QTextOption, QMovie, QLinearGradient, QBrush, QPen, QFontDatabase
-from PyQt5.QtCore import Qt, QSize, QTimer, QPropertyAnimation, QEasingCurve, QRect, QPoint
+from PyQt5.QtCore import Qt, QSize, QTimer, QPropertyAnimation, QEasingCurve, QRect, QPoint, QObject, pyqtSignal
 from dotenv import dotenv_values
 import os
 import sys
 
+# Allow "Backend." imports when the GUI is started on its own.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Backend.EventBus import Publish, Subscribe, STATUS, RESPONSE, MIC, TEXT_INPUT
+from Backend import StatusBoard
+from Backend.StatusBoard import WriteBoard, ReadBoard, BoardChanged
+from Backend.InputQueue import AppendInput
+from Backend.MessageStream import EmitMessage, ReadMessages, USER, ASSISTANT
+from Frontend.FileWatcher import FileWatcher
+
 try:
     env_vars = dotenv_values(".env")
     Assistantname = env_vars.get("Assistantname", "Jarvis")
@@ -16,9 +26,9 @@ except Exception as e:
 
 
 current_dir = os.getcwd()
-old_chat_message = ""
-TempDirPath = rf"{current_dir}\Frontend\Files"
-GraphicsDirPath = rf"{current_dir}\Frontend\Graphics"
+InProcess = True  # False when the GUI runs in its own process and must read the files.
+TempDirPath = os.path.join(current_dir, "Frontend", "Files")
+GraphicsDirPath = os.path.join(current_dir, "Frontend", "Graphics")
 
 # Ensure directories exist
 os.makedirs(TempDirPath, exist_ok=True)
@@ -67,33 +77,27 @@ def QueryModifier(Query):
                   new_query += "."
       return new_query.capitalize()
 
+# The Set*/Get* functions below are the compatibility adapter over the event
+# bus. Mic and assistant status live on the shared status board and typed
+# messages on the input queue, both of which any process can read; chat
+# messages are only written to Responses.jsonl when nothing in this process
+# is listening (an out-of-process GUI).
+
 def SetMicrophoneStatus(Command):
-      with open(rf"{TempDirPath}\Mic.data", "w", encoding="utf-8") as file:
-            file.write(Command)
+      WriteBoard(StatusBoard.MIC, Command)
+      Publish(MIC, Command)
 
 def GetMicrophoneStatus():
-    try:
-      with open(rf"{TempDirPath}\Mic.data", "r", encoding="utf-8") as file:
-            Status = file.read()
+      Status, _ = ReadBoard(StatusBoard.MIC, "True")
       return Status
-    except FileNotFoundError:
-        with open(rf"{TempDirPath}\Mic.data", "w", encoding="utf-8") as file:
-            file.write("True")
-        return "True"
 
 def SetAssistantStatus(Status):
-      with open(rf"{TempDirPath}\Status.data", "w", encoding="utf-8") as file:
-            file.write(Status)
+      WriteBoard(StatusBoard.STATUS, Status)
+      Publish(STATUS, Status)
 
 def GetAssistantStatus():
-    try:
-      with open(rf"{TempDirPath}\Status.data", "r", encoding="utf-8") as file:
-            Status = file.read()
+      Status, _ = ReadBoard(StatusBoard.STATUS, "Available...")
       return Status
-    except FileNotFoundError:
-        with open(rf"{TempDirPath}\Status.data", "w", encoding="utf-8") as file:
-            file.write("Available...")
-        return "Available..."
 
 def MicButtonInitiated():
       SetMicrophoneStatus("False")
@@ -102,21 +106,112 @@ def MicButtonClosed():
       SetMicrophoneStatus("True")
 
 def GraphicsDirectoryPath(Filename):
-      Path = rf"{GraphicsDirPath}\{Filename}"
+      Path = os.path.join(GraphicsDirPath, Filename)
       return Path
 
 def TempDirectoryPath(Filename):
-      Path = rf"{TempDirPath}\{Filename}"
+      Path = os.path.join(TempDirPath, Filename)
       return Path
 
-def ShowTextToScreen(Text):
-      with open(rf"{TempDirPath}\Responses.data", "w", encoding="utf-8") as file:
-            file.write(Text)
+def ShowTextToScreen(Text, message_id=None, final=True):
+      """Show a "Name : text" line as a chat message and return its id.
+
+      The speaker is taken from the prefix only, so answers that happen to
+      contain "Name :" are not split. Pass ``message_id`` to update a message
+      that is still being written.
+      """
+      if not Text:
+            return message_id
+      if Text.startswith(f"{Username} : "):
+            return EmitMessage(USER, Text[len(Username) + 3:], final, message_id)
+      if Text.startswith(f"{Assistantname} : "):
+            return EmitMessage(ASSISTANT, Text[len(Assistantname) + 3:], final, message_id)
+      return EmitMessage(ASSISTANT, Text, final, message_id)
 
 def SaveTextInput(text):
-    """Save text input to be processed by the main application"""
-    with open(rf"{TempDirPath}\TextInput.data", "w", encoding="utf-8") as file:
-        file.write(text)
+    """Queue text input to be processed by the main application.
+
+    Returns the number of messages waiting, including this one.
+    """
+    depth = AppendInput(text)
+    Publish(TEXT_INPUT, text)
+    return depth
+
+class EventBridge(QObject):
+    """Re-emits event bus traffic as Qt signals.
+
+    Bus callbacks run on the publishing (backend) thread; emitting a signal
+    from there queues the call onto the GUI thread that owns the receivers.
+    """
+    statusChanged = pyqtSignal(str)
+    responseChanged = pyqtSignal(object)
+    micChanged = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        Subscribe(STATUS, self.statusChanged.emit)
+        Subscribe(RESPONSE, self.responseChanged.emit)
+        Subscribe(MIC, self.micChanged.emit)
+
+_event_bridge = None
+
+def GetEventBridge():
+    """Return the process-wide bridge, creating it on the GUI thread."""
+    global _event_bridge
+    if _event_bridge is None:
+        _event_bridge = EventBridge()
+    return _event_bridge
+
+class FileChangeNotifier(QObject):
+    """Wakes the GUI when the backend rewrites a file in Frontend/Files.
+
+    Used when the GUI runs in its own process. The watcher already folds a
+    burst of writes into one notification; the signal carries the set of
+    changed file names across to the GUI thread.
+    """
+    filesChanged = pyqtSignal(object)
+
+    def __init__(self):
+        super().__init__()
+        self.watcher = FileWatcher(TempDirPath, ["Responses.jsonl"], self.filesChanged.emit)
+        self.watcher.start()
+
+_file_notifier = None
+
+def GetFileNotifier():
+    global _file_notifier
+    if _file_notifier is None:
+        _file_notifier = FileChangeNotifier()
+    return _file_notifier
+
+class StatusBoardNotifier(QObject):
+    """Signals status changes made by another process on the status board.
+
+    Board writes don't produce file events, so this checks the status
+    sequence number on a short timer; the check is a memory read, not a
+    file read.
+    """
+    statusChanged = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.sequence = -1
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check)
+        self.timer.start(50)
+
+    def check(self):
+        if BoardChanged(StatusBoard.STATUS, self.sequence):
+            status, self.sequence = ReadBoard(StatusBoard.STATUS, "Available...")
+            self.statusChanged.emit(status)
+
+_board_notifier = None
+
+def GetStatusBoardNotifier():
+    global _board_notifier
+    if _board_notifier is None:
+        _board_notifier = StatusBoardNotifier()
+    return _board_notifier
 
 class MessageBubble(QFrame):
     def __init__(self, message, is_user=False):
@@ -130,14 +225,14 @@ class MessageBubble(QFrame):
         layout.setContentsMargins(12, 10, 12, 10)
         
         # Create message text
-        message_label = QLabel(self.message)
-        message_label.setWordWrap(True)
-        message_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.message_label = QLabel(self.message)
+        self.message_label.setWordWrap(True)
+        self.message_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
         
         # Set font
         font = QFont()
         font.setPointSize(11)
-        message_label.setFont(font)
+        self.message_label.setFont(font)
         
         # Set style based on sender
         if self.is_user:
@@ -156,7 +251,7 @@ class MessageBubble(QFrame):
                 border: 1px solid {COLORS['border']};
             """)
         
-        layout.addWidget(message_label)
+        layout.addWidget(self.message_label)
         
         # Add shadow effect
         shadow = QGraphicsDropShadowEffect()
@@ -165,9 +260,16 @@ class MessageBubble(QFrame):
         shadow.setOffset(0, 3)
         self.setGraphicsEffect(shadow)
 
+    def setMessage(self, message):
+        if message != self.message:
+            self.message = message
+            self.message_label.setText(message)
+
 class ChatSection(QWidget):
     def __init__(self):
         super(ChatSection, self).__init__()
+        self.bubbles = {}  # message id -> MessageBubble
+        self.stream_offset = 0  # bytes of Responses.jsonl already applied
         self.initUI()
         
     def initUI(self):
@@ -291,11 +393,17 @@ class ChatSection(QWidget):
         # Set background color
         self.setStyleSheet(f"background-color: {COLORS['background']};")
         
-        # Set up timer to check for new messages
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.loadMessages)
-        self.timer.timeout.connect(self.updateStatus)
-        self.timer.start(100)
+        # Follow updates, then load the transcript written at startup
+        if InProcess:
+            bridge = GetEventBridge()
+            bridge.responseChanged.connect(self.applyMessage)
+            bridge.statusChanged.connect(self.updateStatus)
+            self.updateStatus(GetAssistantStatus())
+        else:
+            self.updateStatus()
+            GetFileNotifier().filesChanged.connect(self.onFilesChanged)
+            GetStatusBoardNotifier().statusChanged.connect(self.updateStatus)
+        self.loadMessages()
         
         # Apply scrollbar styling
         self.scroll_area.setStyleSheet(f"""
@@ -324,14 +432,17 @@ class ChatSection(QWidget):
         """Send the message from the text input field"""
         text = self.text_input.text().strip()
         if text:
-            # Save the text input to be processed by the main application
-            SaveTextInput(text)
+            # Queue the text input to be processed by the main application
+            depth = SaveTextInput(text)
             
             # Clear the input field
             self.text_input.clear()
             
-            # Set status to indicate processing
-            SetAssistantStatus("Processing your message...")
+            # Set status to indicate processing, with the backlog if there is one
+            if depth > 1:
+                SetAssistantStatus(f"Processing your message... ({depth - 1} ahead in queue)")
+            else:
+                SetAssistantStatus("Processing your message...")
     
     def toggle_mic(self):
         if self.mic_toggled:
@@ -343,57 +454,41 @@ class ChatSection(QWidget):
         
         self.mic_toggled = not self.mic_toggled
     
-    def updateStatus(self):
-        status = GetAssistantStatus()
+    def updateStatus(self, status=None):
+        if status is None:
+            status = GetAssistantStatus()
         self.status_label.setText(status)
     
+    def onFilesChanged(self, names):
+        if "Responses.jsonl" in names:
+            self.loadMessages()
+    
     def loadMessages(self):
-        global old_chat_message
+        """Apply the records appended to Responses.jsonl since the last read"""
         try:
-            with open(TempDirectoryPath('Responses.data'), "r", encoding="utf-8") as file:
-                messages = file.read()
-            
-            if messages and messages != old_chat_message:
-                # Clear existing messages
+            messages, self.stream_offset, reset = ReadMessages(self.stream_offset)
+            if reset:
                 self.clearMessages()
-                
-                # Parse and add messages
-                message_pairs = []
-                lines = messages.split('\n')
-                current_speaker = None
-                current_message = []
-                
-                for line in lines:
-                    if line.strip():
-                        if f"{Username} :" in line:
-                            if current_speaker and current_message:
-                                message_pairs.append((current_speaker, ' '.join(current_message)))
-                            current_speaker = "user"
-                            current_message = [line.split(f"{Username} : ", 1)[1]]
-                        elif f"{Assistantname} :" in line:
-                            if current_speaker and current_message:
-                                message_pairs.append((current_speaker, ' '.join(current_message)))
-                            current_speaker = "assistant"
-                            current_message = [line.split(f"{Assistantname} : ", 1)[1]]
-                        else:
-                            current_message.append(line)
-                
-                if current_speaker and current_message:
-                    message_pairs.append((current_speaker, ' '.join(current_message)))
-                
-                # Add message bubbles
-                for speaker, message in message_pairs:
-                    self.addMessage(message, speaker == "user")
-                
-                # Scroll to bottom
-                self.scroll_area.verticalScrollBar().setValue(
-                    self.scroll_area.verticalScrollBar().maximum()
-                )
-                
-                old_chat_message = messages
+            for message in messages:
+                self.applyMessage(message)
         except Exception as e:
             print(f"Error loading messages: {e}")
     
+    def applyMessage(self, message):
+        """Add a bubble for a new message id, or update the text of a known one"""
+        bubble = self.bubbles.get(message["id"])
+        if bubble is not None:
+            bubble.setMessage(message["text"])
+            return
+        
+        bubble = self.addMessage(message["text"], message["role"] == USER)
+        self.bubbles[message["id"]] = bubble
+        
+        # Scroll to bottom
+        self.scroll_area.verticalScrollBar().setValue(
+            self.scroll_area.verticalScrollBar().maximum()
+        )
+    
     def clearMessages(self):
         # Clear all message bubbles
         while self.messages_layout.count():
@@ -401,10 +496,12 @@ class ChatSection(QWidget):
             widget = item.widget()
             if widget:
                 widget.deleteLater()
+        self.bubbles.clear()
     
     def addMessage(self, message, is_user=False):
         bubble = MessageBubble(message, is_user)
         self.messages_layout.addWidget(bubble)
+        return bubble
 
 class InitialScreen(QWidget):
     def __init__(self, parent=None):
@@ -491,13 +588,17 @@ class InitialScreen(QWidget):
         # Set up the widget
         self.setStyleSheet(f"background-color: {COLORS['background']};")
         
-        # Set up timer to update status
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.updateStatus)
-        self.timer.start(100)
+        # Follow status changes
+        if InProcess:
+            GetEventBridge().statusChanged.connect(self.updateStatus)
+            self.updateStatus(GetAssistantStatus())
+        else:
+            self.updateStatus()
+            GetStatusBoardNotifier().statusChanged.connect(self.updateStatus)
     
-    def updateStatus(self):
-        status = GetAssistantStatus()
+    def updateStatus(self, status=None):
+        if status is None:
+            status = GetAssistantStatus()
         self.status_label.setText(status)
 
     def toggle_icon(self, event=None):
@@ -716,7 +817,10 @@ class MainWindow(QMainWindow):
         # Set central widget
         self.setCentralWidget(self.stacked_widget)
 
-def GraphicalUserInterface():
+def GraphicalUserInterface(in_process=True):
+    global InProcess
+    InProcess = in_process
+
     # Create QApplication
     app = QApplication(sys.argv)
     
@@ -747,7 +851,8 @@ def GraphicalUserInterface():
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
-    GraphicalUserInterface()
+    # On its own the GUI talks to the backend through Frontend/Files.
+    GraphicalUserInterface(in_process=False)
 
 
 
@@ -5,23 +5,36 @@ from Frontend.GUI import (
     TempDirectoryPath,
     SetMicrophoneStatus,
     AnswerModifier,
-    QueryModifier,
-    GetMicrophoneStatus,
-    GetAssistantStatus
+    QueryModifier
 )
 
-from Backend.Model import FirstLayerDMM
-from Backend.RealtimeSearchEngine import RealtimeSearchEngine
-from Backend.Automation import Automation
+from Backend.Model import FirstLayerDMMStream
+from Backend.RealtimeSearchEngine import RealtimeSearchEngineStream, GoogleSearch, NoSearchResults
+from Backend.Automation import Automation, Content
 from Backend.SpeechToText import SpeechRecognition, reset_speech_recognition
-from Backend.Chatbot import ChatBot
-from Backend.textToSpeech import TextToSpeech
+from Backend.Chatbot import ChatBotStream, AppendChatExchange
+from Backend.ConversationStore import GetStore
+from Backend.Conversation import GetConversation, CloseConversation
+from Backend.Transcript import UpdateTranscript
+from Backend.textToSpeech import TTS
+from Backend import StatusBoard
+from Backend.StatusBoard import WriteBoard, ReadBoard, BoardChanged
+from Backend.InputQueue import TakeInput, InputQueueDepth, GetInputQueue
+from Frontend.FileWatcher import FileWatcher
+from Backend.MessageStream import ClearMessages, EmitMessage, USER, ASSISTANT
+from Backend.EventBus import Subscribe, MIC, TEXT_INPUT
+from Backend.EventLoop import Submit, StopEventLoop
+from Backend.Cancellation import CancelToken, QueryCancelled, MarkInterrupted
+from Backend.Deadline import Deadline
+from Backend.Scheduler import RunInteractive, SubmitBackground, GetScheduler
+from Backend.Pipeline import QueryContext, AnswerPart, PumpIterator, SpeechPlanner, Speaker, Speculation, END
 from dotenv import dotenv_values
-from asyncio import run
-from time import sleep, time
+from time import time, sleep
 import subprocess
 import threading
-import json
+import asyncio
+import collections
+import queue
 import os
 import sys
 import traceback
@@ -32,10 +45,29 @@ try:
     env_vars = dotenv_values(".env")
     Username = env_vars.get("Username", "User")  # Default to "User" if not found
     Assistantname = env_vars.get("Assistantname", "Jarvis")  # Default to "Jarvis" if not found
+    # Opt-in: start answering (and searching) while the decision model is still classifying
+    SpeculativeAnswer = env_vars.get("SpeculativeAnswer", "False").lower() == "true"
+    SpeculativeSearch = env_vars.get("SpeculativeSearch", "False").lower() == "true"
+    # Opt-in: keep listening while an answer is spoken so speech can interrupt it (use a headset)
+    VoiceBargeIn = env_vars.get("VoiceBargeIn", "False").lower() == "true"
+    # Seconds a query may take until its answer starts, across all stages
+    QueryTimeout = float(env_vars.get("QueryTimeout", 30))
 except Exception as e:
     print(f"Error loading .env file: {e}. Using default values.")
     Username = "User"
     Assistantname = "Jarvis"
+    SpeculativeAnswer = False
+    SpeculativeSearch = False
+    VoiceBargeIn = False
+    QueryTimeout = 30.0
+
+# Longest share of the query budget each stage may use, so later stages keep some
+CLASSIFY_TIMEOUT = 8
+AUTOMATION_TIMEOUT = 10
+SEARCH_TIMEOUT = 6
+
+MAX_PARALLEL_TASKS = 4  # Tasks of one decision that run at the same time
+STARTUP_MESSAGES = 50  # Most recent messages shown in the chat window at startup
 
 DefaultMessage = f'''{Username} : Hello {Assistantname}, How are you?
 {Assistantname} : Welcome {Username}. I am doing well. How may I help you?'''
@@ -47,77 +79,51 @@ Functions = ["open", "close", "play", "system", "content", "google search", "you
 speech_recognition_count = 0
 last_reset_time = time()
 
-# Path to the text input file
-text_input_file = TempDirectoryPath('TextInput.data')
+# Reasons the backend loop wakes up
+WAKE_MIC = "mic"  # The mic was toggled; payload is the new status
+WAKE_TEXT = "text"  # A message was added to the input queue
+WAKE_SPEECH = "speech"  # A capture finished; payload is (query or None, whether it overlapped an answer)
+WAKE_DONE = "done"  # A query pipeline finished; payload is its future
+WAKE_SHUTDOWN = "shutdown"
+
+wakeups = queue.Queue()
+listen_requests = queue.Queue()  # True starts one capture, None stops the listener
+Subscribe(MIC, lambda status: wakeups.put((WAKE_MIC, status)))
+Subscribe(TEXT_INPUT, lambda text: wakeups.put((WAKE_TEXT, None)))
 
 def ShowDefaultChatIfNoChats():
     try:
         # Ensure Data directory exists
         os.makedirs("Data", exist_ok=True)
         
-        # Check if ChatLog.json exists and has content
-        chat_log_path = r'Data/ChatLog.json'
-        if not os.path.exists(chat_log_path) or os.path.getsize(chat_log_path) < 5:
-            # Create a default ChatLog.json
-            with open(chat_log_path, "w", encoding="utf-8") as file:
-                file.write("[]")
-            
-            # Write default messages to data files
-            with open(TempDirectoryPath('Database.data'), 'w', encoding='utf-8') as file:
-                file.write("")
-
-            with open(TempDirectoryPath('Responses.data'), 'w', encoding='utf-8') as file:
-                file.write(DefaultMessage)
+        # Check if the chat history has content
+        if not GetStore().Messages(limit=1):
+            # Write default messages to the chat window
+            for line in DefaultMessage.split("\n"):
+                ShowTextToScreen(line)
     except Exception as e:
         print(f"Error in ShowDefaultChatIfNoChats: {e}")
         traceback.print_exc()
-        # Create a default ChatLog.json if it doesn't exist
-        os.makedirs("Data", exist_ok=True)
-        with open(r'Data/ChatLog.json', "w", encoding="utf-8") as file:
-            file.write("[]")
 
 def ReadChatLogJson():
-    try:
-        with open(r'Data/ChatLog.json', 'r', encoding='utf-8') as file:
-            chatlog_data = json.load(file)
-        return chatlog_data
-    except (json.JSONDecodeError, FileNotFoundError) as e:
-        print(f"Error reading ChatLog.json: {e}")
-        # Create a new empty chat log if there was an error
-        with open(r'Data/ChatLog.json', "w", encoding="utf-8") as file:
-            file.write("[]")
-        return []
+    return GetConversation().Messages()
 
 def ChatLogIntegration():
     try:
-        json_data = ReadChatLogJson()
-        formatted_chatlog = ""
-        for entry in json_data:
-            if entry["role"] == "user":
-                formatted_chatlog += f"User: {entry['content']}\n"
-            elif entry["role"] == "assistant":
-                formatted_chatlog += f"Assistant: {entry['content']}\n"
-
-        formatted_chatlog = formatted_chatlog.replace("User", Username + " ")
-        formatted_chatlog = formatted_chatlog.replace("Assistant", Assistantname + " ")
-
-        with open(TempDirectoryPath('Database.data'), 'w', encoding='utf-8') as file:
-            file.write(AnswerModifier(formatted_chatlog))
+        # Append only the turns logged since the last run to the transcript
+        UpdateTranscript(TempDirectoryPath('Database.data'), user=Username, assistant=Assistantname)
     except Exception as e:
         print(f"Error in ChatLogIntegration: {e}")
         traceback.print_exc()
 
 def ShowChatsOnGUI():
     try:
-        with open(TempDirectoryPath('Database.data'), "r", encoding="utf-8") as file:
-            Data = file.read()
-        
-        if len(str(Data)) > 0:
-            lines = Data.split('\n')
-            result = '\n'.join(lines)
-            
-            with open(TempDirectoryPath('Responses.data'), "w", encoding="utf-8") as file:
-                file.write(result)
+        # Send the most recent turns as their own messages; the roles come from the log itself
+        for entry in GetStore().Messages(limit=STARTUP_MESSAGES):
+            if entry["role"] == "user":
+                EmitMessage(USER, entry["content"])
+            elif entry["role"] == "assistant":
+                EmitMessage(ASSISTANT, AnswerModifier(entry["content"]))
     except Exception as e:
         print(f"Error in ShowChatsOnGUI: {e}")
         traceback.print_exc()
@@ -128,19 +134,17 @@ def InitialExecution():
         os.makedirs("Data", exist_ok=True)
         os.makedirs("Frontend/Files", exist_ok=True)
         
-        # Initialize data files
-        with open(r'Frontend/Files/ImageGeneration.data', "w") as file:
-            file.write("False,False")
-            
-        # Initialize text input file
-        with open(text_input_file, "w", encoding="utf-8") as file:
-            file.write("")
+        # Initialize the image generation slot on the status board
+        WriteBoard(StatusBoard.IMAGE_GENERATION, "False,False")
             
         SetMicrophoneStatus("True")
-        ShowTextToScreen("")
+        ClearMessages()
+        GetStore().StartSession()  # Turns from this run form a new session
         ShowDefaultChatIfNoChats()
         ChatLogIntegration()
         ShowChatsOnGUI()
+        # Load the history for the chat models off the startup path
+        SubmitBackground(GetConversation, name="loading the conversation")
         SetAssistantStatus("Available...")
     except Exception as e:
         print(f"Error in InitialExecution: {e}")
@@ -159,15 +163,9 @@ def handle_image_generation(image_query):
             
         print(f"Generating image with prompt: {prompt}")
         
-        # Write to the image generation data file
-        with open(r'Frontend/Files/ImageGeneration.data', "w") as file:
-            file.write(f"{prompt},True")
-        
-        # Start the image generation process
-        SetAssistantStatus("Generating image...")
-        
-        # Run the image generation script
-        p = subprocess.Popen([sys.executable, r'Backend/Imagegeneration.py'],
+        # Run the image generation script; the prompt goes on its command line, so
+        # concurrent jobs each generate their own
+        p = subprocess.Popen([sys.executable, r'Backend/Imagegeneration.py', prompt],
                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
                             stdin=subprocess.PIPE, shell=False)
         subprocesses.append(p)
@@ -185,16 +183,9 @@ def handle_image_generation(image_query):
             if p.returncode != 0:
                 print(f"Image generation process exited with code {p.returncode}")
                 
-                # Check the status file for more detailed error information
-                try:
-                    with open(r'Frontend/Files/ImageGeneration.data', "r") as file:
-                        status = file.read().strip()
-                        if "API_KEY_MISSING" in status:
-                            return False, "I need a valid HuggingFace API key to generate images. Please run setup_env.py to configure it."
-                        elif "ERROR" in status:
-                            return False, "I encountered an error while generating the image."
-                except Exception:
-                    pass
+                # Imagegeneration.CONFIG_ERROR: the API key or the .env file is missing
+                if p.returncode == 2:
+                    return False, "I need a valid HuggingFace API key to generate images. Please run setup_env.py to configure it."
                     
                 return False, "Image generation failed. Please check the console for error details."
                 
@@ -219,234 +210,574 @@ def handle_image_generation(image_query):
         return False, "I encountered an unexpected error while generating the image."
 
 def check_for_text_input():
-    """Check if there's text input from the GUI"""
+    """Take the oldest queued text input from the GUI, if any"""
     try:
-        if os.path.exists(text_input_file):
-            with open(text_input_file, "r", encoding="utf-8") as file:
-                text = file.read().strip()
-                
+        while True:
+            text = TakeInput()
+            if text is None:
+                return None
+            text = text.strip()
             if text:
-                # Clear the file after reading
-                with open(text_input_file, "w", encoding="utf-8") as file:
-                    file.write("")
-                    
+                remaining = InputQueueDepth()
+                if remaining:
+                    print(f"{remaining} more text input(s) queued")
                 return text
-        return None
     except Exception as e:
         print(f"Error checking for text input: {e}")
         traceback.print_exc()
         return None
 
-def process_query(Query):
-    """Process a query (from speech or text input)"""
-    global speech_recognition_count
-    
-    try:
-        ShowTextToScreen(f"{Username} : {Query}")
+# The speak stage, shared by every query so answers are read out one at a time
+speaker = Speaker(TTS)
+background_tasks = set()  # Strong references to fire-and-forget tasks on the backend loop
+
+async def Say(ctx, utterances, Answer):
+    """Show a complete answer and queue it for speech under the usual long-answer rules"""
+    ShowTextToScreen(f"{Assistantname} : {Answer}")
+    planner = SpeechPlanner()
+    for sentence in planner.feed(Answer):
+        await utterances.put(sentence)
+    await utterances.put(planner.finish())
+
+async def ClassifyStage(ctx, executor):
+    """Ask the decision model what kind of query this is, dispatching each task as soon as it is decided"""
+    with ctx.stage("classify"):
         SetAssistantStatus("Thinking ...")
-        
-        # Get decision from first layer model
+        deadline = ctx.deadline.Stage(CLASSIFY_TIMEOUT)
+        tasks = asyncio.Queue()
+        pump = asyncio.create_task(PumpIterator(lambda: FirstLayerDMMStream(ctx.query, deadline, cancel=ctx.cancel),
+                                                tasks, ctx.cancel))
+        failed = False
         try:
-            Decision = FirstLayerDMM(Query)
-            print(f"\nDecision : {Decision}\n")
-        except Exception as e:
-            print(f"Error in FirstLayerDMM: {e}")
-            traceback.print_exc()
-            Decision = ["general " + Query]  # Default to general query if decision making fails
-
-        G = any([i for i in Decision if i.startswith("general")])
-        R = any([i for i in Decision if i.startswith("realtime")])
+            while True:
+                task = await tasks.get()
+                if task is END:
+                    break
+                if isinstance(task, Exception):
+                    print(f"Error in FirstLayerDMM: {task}")
+                    traceback.print_exception(type(task), task, task.__traceback__)
+                    failed = True
+                    continue
+                if ctx.cancel.cancelled:
+                    continue  # Drain until the stream has been closed
+                ctx.mark("first_task")
+                ctx.decision.append(task)
+                executor.Dispatch(task)
+            if failed and not ctx.decision and not ctx.cancel.cancelled:
+                # Default to general query if decision making fails
+                ctx.decision.append("general " + ctx.query)
+                executor.Dispatch(ctx.decision[-1])
+        finally:
+            await pump
+            executor.Close()
+    print(f"\nDecision : {ctx.decision}\n")
+
+async def Announce(Answer):
+    """Show and speak a message that doesn't answer a query, e.g. a finished background job
+
+    Every message spoken outside a query goes through here, so it takes its
+    turn on the shared speaker instead of playing over an answer.
+    """
+    ctx = QueryContext(Answer)
+    utterances = speaker.Start(ctx)
+    try:
+        await Say(ctx, utterances, Answer)
+    finally:
+        await utterances.put(END)
 
-        # Merge queries for general and realtime decisions
+def ReportBackgroundJob(describe):
+    """Build an on_done callback that tells the user how a background job went"""
+    def on_done(job):
         try:
-            Mearged_query = " and ".join(
-                [" ".join(i.split()[1:]) for i in Decision if i.startswith("general") or i.startswith("realtime")]
-            )
+            message = describe(job.future.result())
         except Exception as e:
-            print(f"Error merging queries: {e}")
-            Mearged_query = Query  # Use original query if merging fails
-
-        # Check for image generation requests
-        ImageExecution = False
-        ImageGenerationQuery = ""
-        for queries in Decision:
-            if "generate image" in queries:
-                ImageGenerationQuery = str(queries)
-                ImageExecution = True
-                break
+            print(f"Background job {job.name} failed: {e}")
+            message = f"Sorry, I couldn't finish {job.name}."
+        print(f"Background job {job.name} finished in {job.finished - job.started:.1f} s")
+        Submit(Announce(message))
+    return on_done
+
+def StartImageGeneration(ImageGenerationQuery):
+    """Generate images as a background job; returns the announcement to make now"""
+    image_prompt = ImageGenerationQuery.replace("generate image", "").strip()
+    SubmitBackground(
+        handle_image_generation, ImageGenerationQuery,
+        name=f"the images of {image_prompt}",
+        on_done=ReportBackgroundJob(lambda result: result[1]),
+    )
+    return f"I'll generate images of {image_prompt} for you and let you know when they're ready."
+
+def StartContentWriting(ContentQuery):
+    """Write content as a background job; returns the announcement to make now"""
+    topic = ContentQuery.removeprefix("content ").strip()
+    SubmitBackground(
+        Content, topic,
+        name=f"writing about {topic}",
+        on_done=ReportBackgroundJob(lambda result: f"I've finished writing about {topic}; it's open in your editor."),
+    )
+    return f"I'm writing about {topic} and will let you know when it's done."
+
+def StartSpeculation(ctx):
+    """Start a general answer (and a search) for the raw query before it is classified.
+
+    Nothing reaches the chat log unless the decision turns out to ask the same
+    question; see DecisionExecutor.
+    """
+    Query = QueryModifier(ctx.query)
+    make_search = (lambda: GoogleSearch(Query, ctx.deadline.Stage(SEARCH_TIMEOUT))) if SpeculativeSearch else None
+    metadata = {"route": "general"}
+    make_answer = lambda: ChatBotStream(Query, save=False, cancel=ctx.cancel, deadline=ctx.deadline, metadata=metadata)
+    return Speculation(Query, make_answer, make_search, metadata)
+
+class DecisionExecutor:
+    """Fan out the tasks of a decision and hand their answers to the render stage in order
+
+    Each task starts as soon as it is dispatched, at most MAX_PARALLEL_TASKS at
+    a time: automation commands run, image and content requests become
+    background jobs with a short notice, and every general and realtime
+    question gets its own model stream. Answers wait until the parts before
+    them are rendered, so a compound request takes as long as its slowest
+    part rather than the sum of its parts.
+    """
+
+    def __init__(self, ctx, speculation=None):
+        self.ctx = ctx
+        self.speculation = speculation
+        self.parts = asyncio.Queue()  # AnswerPart objects in decision order, then END
+        self.answered = []
+        self.commands = []
+        self.exit = False
+        self._tasks = []
+        self._limit = asyncio.Semaphore(MAX_PARALLEL_TASKS)
+
+    def Dispatch(self, task):
+        """Start one task of the decision"""
+        if task.startswith("generate image"):
+            self._AddPart(AnswerPart("notice", task, StartImageGeneration(task)))
+        elif task.startswith("content "):
+            self._AddPart(AnswerPart("notice", task, StartContentWriting(task)))
+        elif task.startswith("general "):
+            self._Answer(AnswerPart("general", task.removeprefix("general ")))
+        elif task.startswith("realtime "):
+            self._Answer(AnswerPart("realtime", task.removeprefix("realtime ")))
+        elif task.startswith("exit"):
+            self.exit = True
+            self._Answer(AnswerPart("exit", "Okay, Bye!"))
+        elif any(task.startswith(func) for func in Functions):
+            self.commands.append(task)
+            self._Start(self._Automate(task))
+        else:
+            print(f"No handler for task: {task}")
+
+    def Close(self):
+        """Mark the end of the decision, answering with a default if nothing was asked"""
+        if not self.answered and not self.commands and not self.ctx.cancel.cancelled:
+            # If no decision was made, return a default message
+            self._AddPart(AnswerPart("notice", "", "I'm not sure how to respond to that. Could you please rephrase?"))
+        self.parts.put_nowait(END)
+
+    async def Wait(self):
+        """Wait for every dispatched task to finish"""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _AddPart(self, part):
+        self.answered.append(part)
+        self.parts.put_nowait(part)
+
+    def _Start(self, coro):
+        self._tasks.append(asyncio.create_task(coro))
+
+    def _Answer(self, part):
+        speculation = self.speculation
+        if (speculation is not None and part.kind == "general" and not speculation.claimed
+                and speculation.Matches(part.query)):
+            part.chunks, pump = speculation.ClaimAnswer()
+            part.metadata = speculation.metadata
+            part.prompt = speculation.prompt
+            print("Speculative answer kept")
+            self._Start(pump)
+        else:
+            self._Start(self._Generate(part, len(self.answered)))
+        self._AddPart(part)
 
-        # Check for automation tasks
-        TaskExecution = False
-        for queries in Decision:
-            if not TaskExecution:
-                if any(queries.startswith(func) for func in Functions):
-                    try:
-                        run(Automation(list(Decision)))
-                        TaskExecution = True
-                    except Exception as e:
-                        print(f"Error in Automation: {e}")
-                        traceback.print_exc()
-
-        # Handle image generation
-        if ImageExecution:
+    async def _Automate(self, command):
+        async with self._limit:
             try:
-                # Inform user that we're generating an image
-                image_prompt = ImageGenerationQuery.replace("generate image", "").strip()
-                response = f"I'll generate images of {image_prompt} for you."
-                ShowTextToScreen(f"{Assistantname} : {response}")
-                SetAssistantStatus("Generating images...")
-                TextToSpeech(response)
-                
-                # Handle the image generation
-                success, message = handle_image_generation(ImageGenerationQuery)
-                
-                ShowTextToScreen(f"{Assistantname} : {message}")
-                TextToSpeech(message)
-                
-                return True
-                
+                await Automation([command], self.ctx.deadline.Stage(AUTOMATION_TIMEOUT))
             except Exception as e:
-                print(f"Error starting ImageGeneration.py: {e}")
+                print(f"Error in Automation: {e}")
                 traceback.print_exc()
-                error_msg = "I encountered an error while trying to generate the image."
-                ShowTextToScreen(f"{Assistantname} : {error_msg}")
-                TextToSpeech(error_msg)
-                return False
 
-        # Handle realtime and general queries
-        if G and R or R:
+    async def _Generate(self, part, index):
+        """Stream one answer part from the chat model into its queue"""
+        ctx = self.ctx
+        async with self._limit:
+            if ctx.cancel.cancelled:
+                part.chunks.put_nowait(END)
+                return
             try:
-                SetAssistantStatus("Searching ...")
-                Answer = RealtimeSearchEngine(QueryModifier(Mearged_query))
-                ShowTextToScreen(f"{Assistantname} : {Answer}")
-                SetAssistantStatus("Answering ...")
-                TextToSpeech(Answer)
-                return True
-            except Exception as e:
-                print(f"Error in RealtimeSearchEngine: {e}")
-                traceback.print_exc()
-                Answer = "I encountered an error while searching. Please try again."
-                ShowTextToScreen(f"{Assistantname} : {Answer}")
-                TextToSpeech(Answer)
-                return False
-        else:
-            for Queries in Decision:
-                try:
-                    if "general" in Queries:
-                        SetAssistantStatus("Thinking ...")
-                        QueryFinal = Queries.replace("general ", "")
-                        Answer = ChatBot(QueryModifier(QueryFinal))
-                        ShowTextToScreen(f"{Assistantname} : {Answer}")
-                        SetAssistantStatus("Answering ...")
-                        TextToSpeech(Answer)
-                        return True
-
-                    elif "realtime" in Queries:
+                part.prompt = Query = QueryModifier(part.query)
+                if part.kind == "realtime":
+                    with ctx.stage(f"retrieve {index}"):
                         SetAssistantStatus("Searching ...")
-                        QueryFinal = Queries.replace("realtime ", "")
-                        Answer = RealtimeSearchEngine(QueryModifier(QueryFinal))
-                        ShowTextToScreen(f"{Assistantname} : {Answer}")
-                        SetAssistantStatus("Answering ...")
-                        TextToSpeech(Answer)
-                        return True
-
-                    elif "exit" in Queries:
-                        QueryFinal = "Okay, Bye!"
-                        Answer = ChatBot(QueryModifier(QueryFinal))
-                        ShowTextToScreen(f"{Assistantname} : {Answer}")
-                        SetAssistantStatus("Answering ...")
-                        TextToSpeech(Answer)
-                        SetAssistantStatus("Exiting...")
-                        
-                        # Clean up processes before exiting
-                        cleanup_resources()
-                        sys.exit(0)
-                except Exception as e:
-                    print(f"Error processing query '{Queries}': {e}")
-                    traceback.print_exc()
-        
-        # If no decision was made, return a default message
-        SetAssistantStatus("Thinking ...")
-        Answer = "I'm not sure how to respond to that. Could you please rephrase?"
-        ShowTextToScreen(f"{Assistantname} : {Answer}")
-        SetAssistantStatus("Answering ...")
-        TextToSpeech(Answer)
-        return True
-        
+                        SearchResults = await self._Search(part, Query)
+                    make_stream = lambda: RealtimeSearchEngineStream(Query, SearchResults, ctx.cancel, ctx.deadline,
+                                                                     save=False, metadata=part.metadata)
+                else:
+                    make_stream = lambda: ChatBotStream(Query, save=False, cancel=ctx.cancel, deadline=ctx.deadline,
+                                                        metadata=part.metadata)
+            except Exception as e:
+                # The render stage is waiting on this part; hand it the error instead
+                part.chunks.put_nowait(e)
+                part.chunks.put_nowait(END)
+                return
+
+            with ctx.stage(f"generate {index}"):
+                await PumpIterator(make_stream, part.chunks, ctx.cancel)
+
+    async def _Search(self, part, Query):
+        """Fetch search results for a realtime part, or answer without them when out of time"""
+        SearchResults = None
+        speculation = self.speculation
+        if speculation is not None and speculation.Matches(part.query):
+            SearchResults = await speculation.ClaimSearch()
+        if SearchResults is None:
+            deadline = self.ctx.deadline.Stage(SEARCH_TIMEOUT)
+            try:
+                SearchResults = await asyncio.wait_for(RunInteractive(GoogleSearch, Query, deadline), deadline.Remaining())
+            except Exception as e:
+                print(f"Search failed or timed out, answering without results: {e!r}")
+                SearchResults = NoSearchResults(Query)
+        return SearchResults
+
+async def RenderStage(ctx, executor, utterances):
+    """Show the answer parts in decision order as they stream in and pass finished sentences on to speech"""
+    planner = SpeechPlanner()
+    message_id = None
+    with ctx.stage("render"):
+        while True:
+            part = await executor.parts.get()
+            if part is END or ctx.cancel.cancelled:
+                break
+            if planner.text:
+                planner.feed("\n")
+            start = len(planner.text)
+            while True:
+                chunk = await part.chunks.get()
+                if chunk is END:
+                    break
+                if isinstance(chunk, Exception):
+                    part.error = chunk
+                    continue
+                if ctx.cancel.cancelled:
+                    continue  # Drain until the stream has been closed
+                if message_id is None:
+                    ctx.mark("first_token")
+                    SetAssistantStatus("Answering ...")
+                for sentence in planner.feed(chunk):
+                    await utterances.put(sentence)
+                message_id = ShowTextToScreen(f"{Assistantname} : {planner.text}", message_id, final=False)
+            part.answer = AnswerModifier(planner.text[start:])
+
+            if ctx.cancel.cancelled:
+                part.interrupted = True
+            elif part.error is not None:
+                print(f"Error answering {part.kind} query '{part.query}': {part.error}")
+                traceback.print_exception(type(part.error), part.error, part.error.__traceback__)
+                ctx.ok = False
+                if part.kind == "realtime":
+                    Answer = "I encountered an error while searching. Please try again."
+                else:
+                    Answer = "I encountered an error. Please try again."
+                for sentence in planner.feed(f" {Answer}"):
+                    await utterances.put(sentence)
+
+        ctx.answer = AnswerModifier(planner.text)
+        if ctx.cancel.cancelled:
+            ctx.interrupted = True
+            if message_id is not None:
+                ShowTextToScreen(f"{Assistantname} : {MarkInterrupted(ctx.answer)}", message_id)
+            return
+
+        # Commands such as "open chrome" have nothing to say; don't leave an empty bubble
+        if message_id is not None or ctx.answer:
+            ShowTextToScreen(f"{Assistantname} : {ctx.answer}", message_id)
+        await utterances.put(planner.finish())
+
+async def CommitStage(ctx, executor):
+    """Log each answered question in decision order, however the streams finished"""
+    with ctx.stage("commit"):
+        for part in executor.answered:
+            if part.kind != "notice" and part.answer and part.error is None:
+                await asyncio.to_thread(AppendChatExchange, part.prompt, part.answer, part.interrupted, **part.metadata)
+
+async def RunQueryPipeline(Query, cancel=None, deadline=None):
+    """classify -> execute every task -> render in order -> speak
+
+    Each task starts as soon as the decision model has written it, and all
+    tasks of the decision run concurrently (see DecisionExecutor).
+    Classify, generate, render and speak overlap: rendering starts with the
+    first chunk and speech with the first finished sentence. The pipeline returns once the
+    answer is rendered; its speak task carries on in the background.
+    """
+    ctx = QueryContext(Query, cancel, deadline or Deadline(QueryTimeout))
+    if ctx.cancel.cancelled:
+        # Cancelled before it started, e.g. by shutdown: don't classify or answer it
+        ctx.interrupted = True
+        return ctx
+
+    utterances = speaker.Start(ctx)
+    ctx.speech_task.add_done_callback(lambda task: print(f"Query finished: {ctx.report()}"))
+    speculation = StartSpeculation(ctx) if SpeculativeAnswer else None
+    try:
+        executor = DecisionExecutor(ctx, speculation)
+        await asyncio.gather(ClassifyStage(ctx, executor), RenderStage(ctx, executor, utterances))
+        await executor.Wait()
+        await CommitStage(ctx, executor)
+        ctx.exit_requested = executor.exit and not ctx.interrupted
+    except QueryCancelled as e:
+        ctx.interrupted = True
+        print(f"Query interrupted: {e}")
+    finally:
+        if speculation is not None:
+            task = asyncio.create_task(speculation.Discard())  # No-op once the answer was claimed
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+        await utterances.put(END)
+        print(f"Answer rendered: {ctx.report()}")
+    return ctx
+
+# The query being answered: (cancel token, future of its pipeline), or None
+active_query = None
+waiting_queries = collections.deque()  # Queries waiting for their turn, oldest first
+TYPED_MESSAGE = None  # A place in waiting_queries for the next message still in the input queue
+last_answer = None  # Cancel token of the last query started; its answer may still be spoken
+queries_started = 0  # Queries started so far, to tell whether one ran during a capture
+
+def AssistantBusy():
+    """Whether a query is being answered, waiting or still being spoken"""
+    return active_query is not None or bool(waiting_queries) or not speaker.WaitUntilIdle(0)
+
+def process_query(Query, interrupt=True):
+    """Queue a query (from speech or text input); queries are answered one at a time, in order
+
+    With ``interrupt`` the answer in progress, including one still being
+    spoken, is cut short so the queue moves on at once. Queries waiting for
+    their turn are never cancelled, so every input is answered exactly once.
+    ``Query`` is TYPED_MESSAGE for a message still in the input queue.
+    """
+    if interrupt and last_answer is not None and (active_query is not None or not speaker.WaitUntilIdle(0)):
+        if last_answer.Cancel("new input"):
+            print("Interrupting the current answer")
+    waiting_queries.append(Query)
+    StartNextQuery()
+    return True
+
+def StartNextQuery():
+    """Start the oldest waiting query unless one is being answered
+
+    The pipeline runs on the backend loop; its WAKE_DONE wake-up is handled by
+    query_finished. The query's budget starts now, not when it was queued.
+    A typed message is only taken from the durable input queue here, so
+    messages still waiting at exit or after a crash are answered on the next
+    start.
+    """
+    global active_query, last_answer, queries_started
+    while active_query is None and waiting_queries:
+        Query = waiting_queries.popleft()
+        if Query is TYPED_MESSAGE:
+            Query = check_for_text_input()
+            if not Query:
+                continue
+            print(f"Processing text input: {Query}")
+        try:
+            ShowTextToScreen(f"{Username} : {Query}")
+            cancel = CancelToken()
+            deadline = Deadline(QueryTimeout)
+            future = Submit(RunQueryPipeline(Query, cancel, deadline))
+            active_query = (cancel, future)
+            last_answer = cancel
+            queries_started += 1
+            future.add_done_callback(lambda f: wakeups.put((WAKE_DONE, f)))
+        except Exception as e:
+            print(f"Error in process_query: {e}")
+            traceback.print_exc()
+            SetAssistantStatus("Error occurred")
+            Submit(Announce("I encountered an error. Please try again."))
+
+def query_finished(future):
+    """Handle a finished pipeline: report errors and carry out an exit request"""
+    global active_query
+    if active_query is not None and active_query[1] is future:
+        active_query = None
+
+    try:
+        ctx = future.result()
     except Exception as e:
         print(f"Error in process_query: {e}")
         traceback.print_exc()
         SetAssistantStatus("Error occurred")
-        Answer = "I encountered an error. Please try again."
-        ShowTextToScreen(f"{Assistantname} : {Answer}")
-        TextToSpeech(Answer)
+        Submit(Announce("I encountered an error. Please try again."))
         return False
 
-def MainExecution():
+    if ctx.exit_requested:
+        speaker.WaitUntilIdle()
+        SetAssistantStatus("Exiting...")
+        
+        # Clean up processes before exiting
+        cleanup_resources()
+        sys.exit(0)
+    return ctx.ok
+
+def SpeechListenerThread():
+    """Run one speech capture per request and report the result as a wake-up"""
     global speech_recognition_count, last_reset_time
     
-    try:
-        # Check if we need to reset speech recognition
-        current_time = time()
-        if speech_recognition_count >= 3 or (current_time - last_reset_time) > 300:  # Reset after 3 uses or 5 minutes
-            print("Periodic reset of speech recognition...")
-            reset_speech_recognition()
-            speech_recognition_count = 0
-            last_reset_time = current_time
-        
-        # First check for text input from GUI
-        text_input = check_for_text_input()
-        if text_input:
-            print(f"Processing text input: {text_input}")
-            return process_query(text_input)
-            
-        # If no text input, try speech recognition
-        SetAssistantStatus("Listening ...")
-        Query = SpeechRecognition()
-        speech_recognition_count += 1
+    while True:
+        if listen_requests.get() is None:
+            return
         
-        # Check if speech recognition returned a valid query
-        if not Query or Query == "I'm having trouble hearing you. Please check your microphone settings.":
-            SetAssistantStatus("Speech recognition failed")
-            ShowTextToScreen(f"{Assistantname} : I'm having trouble hearing you. Please check your microphone settings or type your message.")
-            TextToSpeech("I'm having trouble hearing you. Please check your microphone settings or type your message.")
-            sleep(2)
-            SetAssistantStatus("Available...")
-            return False
+        Query = None
+        started, busy = queries_started, False
+        try:
+            # Check if we need to reset speech recognition
+            current_time = time()
+            if speech_recognition_count >= 3 or (current_time - last_reset_time) > 300:  # Reset after 3 uses or 5 minutes
+                print("Periodic reset of speech recognition...")
+                reset_speech_recognition()
+                speech_recognition_count = 0
+                last_reset_time = current_time
             
-        return process_query(Query)
-        
-    except Exception as e:
-        print(f"Error in MainExecution: {e}")
-        traceback.print_exc()
-        SetAssistantStatus("Error occurred")
-        Answer = "I encountered an error. Please try again."
-        ShowTextToScreen(f"{Assistantname} : {Answer}")
-        TextToSpeech(Answer)
+            # Don't capture our own voice: wait for the previous answer to be spoken
+            if not VoiceBargeIn:
+                speaker.WaitUntilIdle()
+            SetAssistantStatus("Listening ...")
+            started, busy = queries_started, AssistantBusy()
+            Query = SpeechRecognition()
+            speech_recognition_count += 1
+        except Exception as e:
+            print(f"Error in speech recognition: {e}")
+            traceback.print_exc()
+        finally:
+            # The capture overlapped an answer if one was under way when it started or
+            # ended, or one started and finished in between
+            overlapped = busy or queries_started != started or AssistantBusy()
+            wakeups.put((WAKE_SPEECH, (Query, overlapped)))
+
+def handle_speech_result(Query, overlapped=False):
+    """Process a captured utterance, or tell the user that nothing was heard
+
+    Only with VoiceBargeIn does an utterance interrupt the answer in progress.
+    Without it, an utterance whose capture overlapped an answer is dropped: it
+    may be the assistant's own speech picked up by the microphone.
+    """
+    # Check if speech recognition returned a valid query
+    if not Query or Query == "I'm having trouble hearing you. Please check your microphone settings.":
+        if overlapped:
+            return False  # Nothing heard over the answer being given; don't interrupt it
+        SetAssistantStatus("Speech recognition failed")
+        Submit(Announce("I'm having trouble hearing you. Please check your microphone settings or type your message."))
+        return False
+
+    if overlapped and not VoiceBargeIn:
+        print(f"Dropping an utterance heard while an answer was given: {Query}")
         return False
+    return process_query(Query, interrupt=VoiceBargeIn)
+
+MIC_CHECK_INTERVAL = 0.05  # Seconds between checks of the mic field on the status board
+
+def MicWatcherThread():
+    """Post a wake-up whenever the mic field on the status board changes
+
+    The board is shared memory, so writes to it raise no file events; checking
+    the field's sequence number is a single read from the mapping.
+    """
+    status, sequence = ReadBoard(StatusBoard.MIC, "True")
+    while True:
+        sleep(MIC_CHECK_INTERVAL)
+        if BoardChanged(StatusBoard.MIC, sequence):
+            status, sequence = ReadBoard(StatusBoard.MIC, "True")
+            wakeups.put((WAKE_MIC, status))
+
+def StartCrossProcessWatchers():
+    """Wake the backend for a GUI running in its own process
+
+    A standalone GUI writes the mic state to the status board and appends
+    typed messages to the input queue, but can't publish on this process's
+    event bus. Wake-ups from both arrive twice when the GUI runs in this
+    process, which is harmless: the mic state is set, not toggled, and an
+    empty input queue is simply drained again.
+    """
+    queue_path = GetInputQueue().path
+    FileWatcher(os.path.dirname(queue_path), [os.path.basename(queue_path)],
+                lambda names: wakeups.put((WAKE_TEXT, None))).start()
+    threading.Thread(target=MicWatcherThread, name="MicWatcher", daemon=True).start()
+
+def RequestShutdown():
+    wakeups.put((WAKE_SHUTDOWN, None))
 
 def FirstThread():
+    """Backend state machine, blocked on wake-ups between states.
+
+    IDLE: mic off, nothing to do. LISTENING: a capture is running on the
+    listener thread. PROCESSING: a query is being answered on the backend
+    loop. Queries are answered one at a time in the order they came in. A
+    typed message, or an utterance with VoiceBargeIn, interrupts the answer
+    in progress so the queue moves on at once; messages typed together are
+    all answered. Otherwise the next capture starts as soon as an answer is
+    finished.
+    """
+    mic_on = ReadBoard(StatusBoard.MIC, "True")[0] == "True"
+    listening = False
+    
+    # Messages left in the durable queue by a previous run
+    if InputQueueDepth():
+        wakeups.put((WAKE_TEXT, None))
+    
     while True:
         try:
-            CurrentStatus = GetMicrophoneStatus()
-
-            if CurrentStatus == "True":
-                result = MainExecution()
-                # Add a short delay after processing to prevent CPU overuse
-                sleep(1)
-                if result:
-                    SetAssistantStatus("Available...")
-            else:
-                AIStatus = GetAssistantStatus()
-
-                if "Available..." in AIStatus:
-                    sleep(0.1)
-                else:
-                    SetAssistantStatus("Available...")
+            processing = active_query is not None or bool(waiting_queries)
+            if mic_on and not listening and (VoiceBargeIn or not processing):
+                listening = True
+                listen_requests.put(True)
+            elif not listening and not processing:
+                SetAssistantStatus("Available...")
+            
+            reason, payload = wakeups.get()
+            
+            if reason == WAKE_SHUTDOWN:
+                waiting_queries.clear()  # Typed messages stay in the input queue for the next start
+                if active_query is not None:
+                    active_query[0].Cancel("shutdown")
+                listen_requests.put(None)
+                return
+            
+            if reason == WAKE_MIC:
+                mic_on = payload == "True"
+            
+            elif reason == WAKE_TEXT:
+                # Give each new message a place in line; it stays in the input queue until
+                # its turn. Only the first of the messages queued together interrupts the
+                # answer in progress.
+                arrived = InputQueueDepth() - waiting_queries.count(TYPED_MESSAGE)
+                for i in range(arrived):
+                    process_query(TYPED_MESSAGE, interrupt=i == 0)
+                if arrived > 0 and len(waiting_queries) > 1:
+                    SetAssistantStatus(f"Processing your message... ({len(waiting_queries) - 1} ahead in queue)")
+            
+            elif reason == WAKE_SPEECH:
+                listening = False
+                # An utterance captured after the mic was switched off is dropped
+                if mic_on:
+                    handle_speech_result(*payload)
+            
+            elif reason == WAKE_DONE:
+                query_finished(payload)
+                StartNextQuery()
         except Exception as e:
             print(f"Error in FirstThread: {e}")
             traceback.print_exc()
-            sleep(1)  # Sleep briefly before continuing the loop
+            SetAssistantStatus("Error occurred")
 
 def SecondThread():
     try:
@@ -457,6 +788,12 @@ def SecondThread():
         sys.exit(1)  # Exit if GUI fails
 
 def cleanup_resources():
+    # Drop background jobs that haven't started
+    GetScheduler().Shutdown()
+
+    # Write the last turns of the conversation
+    CloseConversation()
+    
     # Terminate all subprocesses
     for p in subprocesses:
         try:
@@ -482,6 +819,9 @@ if __name__ == "__main__":
                 f.write("GroqAPIKey=your_groq_api_key\n")
                 f.write("HuggingFaceAPIKey=your_huggingface_api_key\n")
         
+        listener = threading.Thread(target=SpeechListenerThread, daemon=True)
+        listener.start()
+        StartCrossProcessWatchers()
         thread1 = threading.Thread(target=FirstThread, daemon=True)
         thread1.start()
         SecondThread()
@@ -491,7 +831,9 @@ if __name__ == "__main__":
         print(f"Error in main execution: {e}")
         traceback.print_exc()
     finally:
+        RequestShutdown()
         cleanup_resources()
+        StopEventLoop()
 
 
 